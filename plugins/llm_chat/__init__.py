@@ -12,23 +12,30 @@ from nonebot.exception import MatcherException
 from nonebot.plugin import PluginMetadata
 from nonebot.adapters.onebot.v11.exception import ActionFailed
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
-from langgraph.checkpoint.memory import MemorySaver
-from .graph import build_graph, get_llm, format_messages_for_print
-from datetime import datetime
-from typing import Dict, List
+from .checkpoint import BoundedMemorySaver
+from .log import logger
+from .core_tools import forget_thread
+from .graph import build_graph, get_llm, format_messages_for_print, setup_llm_cache
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional, Tuple
+from functools import partial
 from random import choice
 from .config import Config
 from .utils import (
     extract_media_urls,
     send_in_chunks,
+    send_stream_chunk,
+    split_stream_buffer,
     get_user_name,
     build_message_content,
     remove_trigger_words,
     filter_sensitive_words,
+    KeywordAutomaton,
 )
 import asyncio
 import os
 import re
+import time
 from .config import plugin_config
 
 __plugin_meta__ = PluginMetadata(
@@ -50,76 +57,77 @@ from .skills import get_tools_for_skills, SKILL_REGISTRY
 class Session:
     def __init__(self, thread_id: str):
         self.thread_id = thread_id
-        self.memory = MemorySaver()
-        # 最后访问时间
-        self.last_accessed = datetime.now()
-        self.graph = None
-        self.lock = asyncio.Lock()  # 添加会话锁
-        self.processing = False  # 添加处理状态标志
-        self.processing_start_time = None  # 处理开始时间
+        # 最后访问时间(time.monotonic)
+        self.last_accessed = time.monotonic()
+        self.lock = asyncio.Lock()  # 会话锁，调用 LangGraph 期间持有
+        # 处理期间到达的消息，等待当前处理结束后合并为一次调用
+        self.pending: List[Tuple[str, asyncio.Future]] = []
         # Default skills - can be customized per user
         self.active_skills = ["sgu", "weather"]
 
     @property
     def is_expired(self) -> bool:
         """判断会话是否过期"""
-        now = datetime.now()
         # 超过CLEANUP_INTERVAL秒未访问则过期
-        return (now - self.last_accessed).total_seconds() > CLEANUP_INTERVAL
-
-    @property
-    def is_processing_timeout(self) -> bool:
-        """判断处理是否超时"""
-        if not self.processing or not self.processing_start_time:
-            return False
-        now = datetime.now()
-        # 处理时间超过60秒判定为超时
-        return (now - self.processing_start_time).total_seconds() > 60
+        return time.monotonic() - self.last_accessed > CLEANUP_INTERVAL
 
     def refresh(self):
-        """刷新最后访问时间"""
-        self.last_accessed = datetime.now()
-
-    def try_acquire_lock(self) -> bool:
-        """尝试获取锁"""
-        if self.processing:
-            if self.is_processing_timeout:
-                self.processing = False
-                self.processing_start_time = None
-            else:
-                return False
-        return True
-
-    async def start_processing(self):
-        """开始处理"""
-        self.processing = True
-        self.processing_start_time = datetime.now()
-        self.refresh()
+        """刷新最后访问时间，并移动到LRU队尾"""
+        self.last_accessed = time.monotonic()
+        shard = _session_shards[_shard_index(self.thread_id)]
+        if self.thread_id in shard:
+            shard.move_to_end(self.thread_id)
 
-    async def end_processing(self):
-        """结束处理"""
-        self.processing = False
-        self.processing_start_time = None
-        self.refresh()
 
+# 会话表按 thread_id 哈希分片，每个分片独立加锁，避免所有会话争用同一把锁
+SESSION_SHARDS = 16
 
 # "group_123456_789012": Session对象1
-sessions: Dict[str, Session] = {}
+# 每个分片按最后访问时间排序(LRU)，队首为最久未访问的会话
+_session_shards: List["OrderedDict[str, Session]"] = [
+    OrderedDict() for _ in range(SESSION_SHARDS)
+]
+_shard_locks: List[asyncio.Lock] = [asyncio.Lock() for _ in range(SESSION_SHARDS)]
+
+
+def _shard_index(thread_id: str) -> int:
+    """计算会话所在分片"""
+    return hash(thread_id) % SESSION_SHARDS
 
-# 添加异步锁保护sessions字典
-sessions_lock = asyncio.Lock()
 
 CLEANUP_INTERVAL = 600  # 会话清理间隔(秒) 例:10分钟
-LAST_CLEANUP_TIME = datetime.now()
+PROCESSING_TIMEOUT = 60  # 单次调用 LangGraph 的超时时间(秒)
+# 排队消息等待被并入批次的最长时间(秒)，并入后不再计时
+BATCH_WAIT_TIMEOUT = 2 * PROCESSING_TIMEOUT
+MAX_CHECKPOINT_THREADS = 512  # 最多保留对话历史的会话数
+LAST_CLEANUP_TIME = time.monotonic()
 
 
 async def cleanup_sessions():
-    """清理过期会话"""
-    async with sessions_lock:
-        expired_keys = [k for k, s in sessions.items() if s.is_expired]
-        for k in expired_keys:
-            del sessions[k]
-    return len(expired_keys)
+    """清理过期会话
+
+    从LRU队首开始淘汰，遇到第一个未过期的会话即停止；
+    正在处理中的会话跳过，放回队首等待下次清理。
+    """
+    cleaned = 0
+    for shard, lock in zip(_session_shards, _shard_locks):
+        busy = []
+        async with lock:
+            while shard:
+                thread_id, session = next(iter(shard.items()))
+                if not session.is_expired:
+                    break
+                shard.popitem(last=False)
+                if session.lock.locked():
+                    busy.append((thread_id, session))
+                else:
+                    checkpointer.delete_thread(thread_id)
+                    forget_thread(thread_id)
+                    cleaned += 1
+            for thread_id, session in reversed(busy):
+                shard[thread_id] = session
+                shard.move_to_end(thread_id, last=False)
+    return cleaned
 
 
 async def get_or_create_session(thread_id: str) -> Session:
@@ -127,37 +135,89 @@ async def get_or_create_session(thread_id: str) -> Session:
     global LAST_CLEANUP_TIME
 
     # 每隔CLEANUP_INTERVAL秒检查一次过期会话
-    now = datetime.now()
-    if (now - LAST_CLEANUP_TIME).total_seconds() > CLEANUP_INTERVAL:
+    now = time.monotonic()
+    if now - LAST_CLEANUP_TIME > CLEANUP_INTERVAL:
         cleaned = await cleanup_sessions()
         if cleaned > 0:
-            print(f"已清理 {cleaned} 个过期会话")
+            logger.info(f"已清理 {cleaned} 个过期会话")
         LAST_CLEANUP_TIME = now
 
-    async with sessions_lock:
-        if thread_id not in sessions:
-            sessions[thread_id] = Session(thread_id)
-        session = sessions[thread_id]
+    index = _shard_index(thread_id)
+    shard = _session_shards[index]
+    async with _shard_locks[index]:
+        if thread_id not in shard:
+            shard[thread_id] = Session(thread_id)
+        session = shard[thread_id]
         session.refresh()
         return session
 
 
+def _drop_session(shard: "OrderedDict[str, Session]", thread_id: str):
+    """清除会话历史并移除会话对象
+
+    会话锁被持有时(调用中或排队消息等待接管)保留会话对象，
+    避免新建的会话与仍在处理的批次同时写入同一 thread_id
+    """
+    session = shard.get(thread_id)
+    if session is not None and not session.lock.locked():
+        del shard[thread_id]
+    checkpointer.delete_thread(thread_id)
+    forget_thread(thread_id)
+
+
+async def remove_session(thread_id: str):
+    """删除指定会话"""
+    index = _shard_index(thread_id)
+    async with _shard_locks[index]:
+        _drop_session(_session_shards[index], thread_id)
+
+
+async def remove_sessions(predicate: Optional[Callable[[str], bool]] = None) -> int:
+    """删除所有满足条件的会话，未指定条件时清空全部会话"""
+    removed = 0
+    for shard, lock in zip(_session_shards, _shard_locks):
+        async with lock:
+            keys = [key for key in shard if predicate is None or predicate(key)]
+            for key in keys:
+                _drop_session(shard, key)
+            removed += len(keys)
+    if predicate is None:
+        checkpointer.clear()
+        forget_thread()
+    return removed
+
+
 # 初始化模型和对话图
 llm = None
 graph_builder = None
+# 所有会话共享的编译后对话图，会话状态由 checkpointer 按 thread_id 隔离
+chat_graph = None
+
+
+def _session_busy(thread_id: str) -> bool:
+    """会话是否正在调用 LangGraph"""
+    session = _session_shards[_shard_index(thread_id)].get(thread_id)
+    return session is not None and session.lock.locked()
+
+
+checkpointer = BoundedMemorySaver(
+    max_threads=MAX_CHECKPOINT_THREADS, is_busy=_session_busy
+)
 
 
 async def initialize_resources():
-    global llm, graph_builder
+    global llm, graph_builder, chat_graph
     if llm is None:
+        setup_llm_cache(plugin_config.llm.cache_backend, plugin_config.llm.cache_url)
         llm = await get_llm()
         graph_builder = await build_graph(plugin_config, llm)
+        chat_graph = graph_builder.compile(checkpointer=checkpointer)
 
 
 async def _process_llm_response(result: dict, thread_id: str) -> str:
     """处理LLM返回的消息，提取回复内容"""
     if not result["messages"]:
-        print("警告: 结果消息列表为空")
+        logger.warning("警告: 结果消息列表为空")
         return plugin_config.responses.assistant_empty_reply
 
     last_message = result["messages"][-1]
@@ -169,9 +229,9 @@ async def _process_llm_response(result: dict, thread_id: str) -> str:
                 and last_message.invalid_tool_calls
             ):
                 error_msg = last_message.invalid_tool_calls[0]["error"]
-                print(f"工具调用错误: {error_msg}")
+                logger.error(f"工具调用错误: {error_msg}")
                 return f"工具调用失败: {error_msg}"
-            print("工具调用错误: 未知错误(无错误信息)")
+            logger.error("工具调用错误: 未知错误(无错误信息)")
             return "工具调用失败，但没有错误信息"
         if (not last_message.content) or (not last_message.content.strip()):
             # 检查是否是 AI 安全拦截
@@ -179,22 +239,18 @@ async def _process_llm_response(result: dict, thread_id: str) -> str:
                 "finish_reason"
             )
             if finish_reason == "SAFETY":
-                print("AI消息安全拦截，阻断回复 -> 清理会话")
-                async with sessions_lock:
-                    if thread_id in sessions:
-                        del sessions[thread_id]
+                logger.warning("AI消息安全拦截，阻断回复 -> 清理会话")
+                await remove_session(thread_id)
                 return "AI消息因安全策略被拦截。"
 
-            print("空回复 -> 清理会话")
-            async with sessions_lock:
-                if thread_id in sessions:
-                    del sessions[thread_id]
+            logger.warning("空回复 -> 清理会话")
+            await remove_session(thread_id)
             return "对不起，我没有理解您的问题。"
 
         if last_message.content:
             return last_message.content.strip()
 
-        print("警告: AI消息内容为空")
+        logger.warning("警告: AI消息内容为空")
         return "对不起，我没有理解您的问题。"
 
     if isinstance(last_message, ToolMessage) and last_message.content:
@@ -204,21 +260,19 @@ async def _process_llm_response(result: dict, thread_id: str) -> str:
             else str(last_message.content)
         )
 
-    print(f"警告: 未知的消息类型或内容为空: {type(last_message)}")
+    logger.warning(f"警告: 未知的消息类型或内容为空: {type(last_message)}")
     return "对不起，我没有理解您的问题。"
 
 
 async def _handle_langgraph_error(e: Exception, thread_id: str) -> str:
     """处理 LangGraph 调用的异常"""
     error_message = str(e)
-    print(f"调用 LangGraph 时发生错误: {error_message}")
-    print(f"错误类型: {type(e)}")
-    print(f"完整异常信息: {e}")
-
-    print("出现异常 -> 清理会话")
-    async with sessions_lock:
-        if thread_id in sessions:
-            del sessions[thread_id]
+    logger.error(f"调用 LangGraph 时发生错误: {error_message}")
+    logger.error(f"错误类型: {type(e)}")
+    logger.error(f"完整异常信息: {e}")
+
+    logger.warning("出现异常 -> 清理会话")
+    await remove_session(thread_id)
     return (
         plugin_config.responses.token_limit_error
         if "'list' object has no attribute 'strip'" in error_message
@@ -226,24 +280,312 @@ async def _handle_langgraph_error(e: Exception, thread_id: str) -> str:
     )
 
 
+# 媒体链接正则，单次扫描同时匹配三种媒体，命名分组即媒体类型
+_MEDIA_RE = re.compile(
+    r"(?P<image>(?:https?://|file:///)[^\s]+?\.(?:png|jpg|jpeg|gif|bmp|webp))"
+    r"|(?P<video>(?:https?://|file:///)[^\s]+?\.(?:mp4|avi|mov|mkv))"
+    r"|(?P<audio>(?:https?://|file:///)[^\s]+?\.(?:mp3|wav|ogg|aac|flac))",
+    re.IGNORECASE,
+)
+
+# 媒体类型到消息段构造函数的映射
+MEDIA_PATTERNS = {
+    "image": {"segment_func": MessageSegment.image, "error_msg": "图片"},
+    "video": {"segment_func": MessageSegment.video, "error_msg": "视频"},
+    "audio": {"segment_func": MessageSegment.record, "error_msg": "音频"},
+}
+
+# markdown链接语法 [text](url) / ![alt](url)
+_MD_LINK_RE = re.compile(r"!?\[[^\]]*\]\(([^)]*)\)")
+
+
+async def process_media_message(response: str, media_type: str, url: str) -> Message:
+    """处理包含媒体的消息"""
+    media_info = MEDIA_PATTERNS[media_type]
+    if plugin_config.plugin.media_include_text:
+        # 清理markdown链接语法，媒体链接本身直接移除
+        message_content = _MD_LINK_RE.sub(
+            lambda m: "" if m.group(1) == url else m.group(1), response
+        )
+        message_content = message_content.replace(url, "").strip()
+        try:
+            return Message(message_content) + media_info["segment_func"](url)
+        except ActionFailed:
+            return Message(message_content) + MessageSegment.text(
+                f" ({media_info['error_msg']}发送失败)"
+            )
+        except MatcherException:
+            raise
+        except Exception as e:
+            return Message(message_content) + MessageSegment.text(f" (未知错误: {e})")
+    else:
+        # 仅发送媒体
+        try:
+            return Message(media_info["segment_func"](url))
+        except ActionFailed:
+            return Message(f"{media_info['error_msg']}发送失败")
+        except MatcherException:
+            raise
+        except Exception as e:
+            return Message(f"未知错误: {e}")
+
+
+async def _stream_graph(
+    inputs: dict, config: dict, emit: Callable[[str], None]
+) -> Tuple[dict, List[str]]:
+    """流式调用 LangGraph，模型输出中每出现一个完整分段就交给 emit
+
+    输出中出现媒体链接后不再切分，剩余部分(含链接)随最终回复一起处理。
+    返回最终状态，以及最后一次模型输出中已交出的分段
+    """
+    text = ""
+    consumed = 0
+    held = False
+    emitted: List[str] = []
+    async for event in chat_graph.astream_events(inputs, config, version="v2"):
+        # 只处理对话节点的模型输出，忽略工具内部的模型调用
+        if event.get("metadata", {}).get("langgraph_node") != "chatbot":
+            continue
+        kind = event["event"]
+        if kind == "on_chat_model_start":
+            text = ""
+            consumed = 0
+            held = False
+            emitted = []
+        elif kind == "on_chat_model_stream":
+            content = event["data"]["chunk"].content
+            if not content or not isinstance(content, str):
+                continue
+            text += content
+            if held:
+                continue
+            if _MEDIA_RE.search(text, consumed):
+                # 媒体链接及之后的内容留给最终回复发送
+                held = True
+                continue
+            chunks, consumed = split_stream_buffer(text, consumed)
+            for chunk in chunks:
+                emit(chunk)
+            emitted += chunks
+
+    state = await chat_graph.aget_state(config)
+    return state.values, emitted
+
+
+def _unsent_tail(response: str, sent: List[str]) -> str:
+    """去掉回复中已流式发送的分段，只返回未发送的部分
+
+    回复中找不到任何已发送分段时(如错误提示)原样返回；
+    只找到一部分时说明回复被改写，不再发送以免重复
+    """
+    pos = 0
+    for matched, chunk in enumerate(sent):
+        index = response.find(chunk, pos)
+        if index == -1:
+            if matched == 0:
+                return response
+            logger.warning("回复与已发送的分段不一致，不再发送剩余部分")
+            return ""
+        pos = index + len(chunk)
+    tail = response[pos:].strip()
+    # 去掉紧跟已发送分段的分隔符
+    separators = tuple(word for word in plugin_config.plugin.chunk.words if word)
+    while separators and tail.startswith(separators):
+        sep = next(word for word in separators if tail.startswith(word))
+        tail = tail[len(sep) :].strip()
+    return tail
+
+
+async def _send_chunks(
+    queue: "asyncio.Queue[Optional[str]]",
+    on_chunk: Callable[[str], Awaitable[None]],
+):
+    """按顺序发送流式分段，直到收到 None"""
+    while (chunk := await queue.get()) is not None:
+        try:
+            await on_chunk(chunk)
+        except Exception as e:
+            logger.error(f"流式分段发送失败: {e}")
+
+
+async def _invoke_graph(
+    session: Session,
+    thread_id: str,
+    message_content: str,
+    on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
+) -> str:
+    """调用 LangGraph 并返回回复文本，调用方需持有会话锁
+
+    传入 on_chunk 时流式调用，已通过 on_chunk 发送的部分不再包含在返回值中
+    """
+    try:
+        # Get active tools for this session
+        active_tools = get_tools_for_skills(session.active_skills)
+        inputs = {
+            "messages": [HumanMessage(content=message_content)],
+            "active_tools": active_tools,  # Pass dynamic tools to graph
+        }
+        config = {"configurable": {"thread_id": thread_id}}
+
+        # 超时后取消调用并按异常处理，锁随调用方退出而释放
+        streamed: List[str] = []
+        if on_chunk is None:
+            result = await asyncio.wait_for(
+                chat_graph.ainvoke(inputs, config), timeout=PROCESSING_TIMEOUT
+            )
+        else:
+            # 分段在单独的任务中发送，发送和打字延迟不计入调用超时
+            queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+            sender = asyncio.create_task(_send_chunks(queue, on_chunk))
+            try:
+                result, streamed = await asyncio.wait_for(
+                    _stream_graph(inputs, config, queue.put_nowait),
+                    timeout=PROCESSING_TIMEOUT,
+                )
+            finally:
+                # 已生成的分段发完再返回，保证与剩余回复的顺序
+                queue.put_nowait(None)
+                await sender
+        truncated_messages = result["messages"][-2:]
+        logger.info(format_messages_for_print(truncated_messages))
+
+        response = await _process_llm_response(result, thread_id)
+        # 去掉已经流式发送的部分
+        if streamed:
+            response = _unsent_tail(response, streamed)
+        return response
+    except Exception as e:
+        return await _handle_langgraph_error(e, thread_id)
+    finally:
+        session.refresh()
+
+
+# 交给排队消息的信号: 由该消息接管会话锁并处理当前排队的批次
+_TAKE_OVER = object()
+
+
+def _hand_over(session: Session):
+    """当前批次结束后移交会话锁
+
+    有排队消息时由最后一条接管(锁保持持有，新消息继续排队)，否则释放锁
+    """
+    waiting = [fut for _, fut in session.pending if not fut.done()]
+    if waiting:
+        waiting[-1].set_result(_TAKE_OVER)
+    else:
+        session.pending = []
+        session.lock.release()
+
+
+async def _submit_message(
+    session: Session,
+    thread_id: str,
+    message_content: str,
+    on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
+) -> Optional[str]:
+    """提交消息到会话，返回回复文本
+
+    会话空闲时由当前消息负责调用 LangGraph；处理期间到达的消息排队，
+    当前调用结束后由最后一条排队消息接管，合并为一次调用，回复交给
+    该批次最后一条消息发送，其余消息返回 None。每个处理者只处理一个
+    批次，回复按批次顺序返回。
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    session.pending.append((message_content, future))
+
+    if session.lock.locked():
+        # 会话处理中，等待处理者合并处理本消息或移交会话锁
+        try:
+            await asyncio.wait((future,), timeout=BATCH_WAIT_TIMEOUT)
+            if not future.done() and any(item[1] is future for item in session.pending):
+                # 超时仍在排队，放弃本消息
+                session.pending = [
+                    item for item in session.pending if item[1] is not future
+                ]
+                return plugin_config.responses.session_busy_message
+            # 已并入批次的消息不再计时，等待该批次结束
+            result = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            session.pending = [
+                item for item in session.pending if item[1] is not future
+            ]
+            if (
+                future.done()
+                and not future.cancelled()
+                and future.result() is _TAKE_OVER
+            ):
+                # 恰好被指定接管，继续移交给下一条排队消息
+                _hand_over(session)
+            raise
+        if result is not _TAKE_OVER:
+            return result
+        # 接管会话锁，换用新的 future 接收本批次的结果
+        index = next(i for i, item in enumerate(session.pending) if item[1] is future)
+        future = loop.create_future()
+        session.pending[index] = (message_content, future)
+    else:
+        await session.lock.acquire()
+
+    batch, session.pending = session.pending, []
+    try:
+        response = await _invoke_graph(
+            session,
+            thread_id,
+            "\n\n".join(content for content, _ in batch),
+            on_chunk,
+        )
+        waiting = [fut for _, fut in batch if not fut.done()]
+        for fut in waiting[:-1]:
+            fut.set_result(None)
+        if waiting:
+            waiting[-1].set_result(response)
+    finally:
+        # 调用被取消时也不让同批次消息一直等待
+        for _, fut in batch:
+            if not fut.done():
+                fut.set_result(None)
+        _hand_over(session)
+    return future.result()
+
+
+def _thread_key(event: MessageEvent) -> Tuple[str, str]:
+    """构建会话ID(thread_id)和传递给LangGraph的消息ID"""
+    if isinstance(event, GroupMessageEvent):
+        if plugin_config.plugin.group_chat_isolation:
+            thread_id = f"group_{event.group_id}_{event.user_id}"
+        else:
+            thread_id = f"group_{event.group_id}"
+        return thread_id, f"Group_ID: {event.group_id}\nUser_ID: {event.user_id}"
+    return f"private_{event.user_id}", f"User_ID: {event.user_id}"
+
+
+# 触发词匹配，模块加载时预先构建
+_TRIGGER_AC = KeywordAutomaton(
+    {word: word for word in plugin_config.plugin.trigger_words}
+)
+_TRIGGER_PREFIXES = tuple(plugin_config.plugin.trigger_words)
+
+
 def _chat_rule(event: Event) -> bool:
     """定义触发规则"""
     trigger_mode = plugin_config.plugin.trigger_mode
-    trigger_words = plugin_config.plugin.trigger_words
-    msg = str(event.get_message())
 
-    if "at" in trigger_mode and event.is_tome():
-        return True
-    if "keyword" in trigger_mode:
-        for word in trigger_words:
-            if word in msg:
-                return True
-    if "prefix" in trigger_mode:
-        for word in trigger_words:
-            if msg.startswith(word):
-                return True
     if not trigger_mode:
         return event.is_tome()
+    if "at" in trigger_mode and event.is_tome():
+        return True
+
+    keyword = "keyword" in trigger_mode
+    prefix = "prefix" in trigger_mode
+    if not (keyword or prefix):
+        return False
+
+    msg = str(event.get_message())
+    if keyword and _TRIGGER_AC.search(msg):
+        return True
+    if prefix and msg.startswith(_TRIGGER_PREFIXES):
+        return True
     return False
 
 
@@ -259,8 +601,6 @@ async def handle_chat(
     # 提取纯文本
     plain_text: str = EventPlainText(),
 ):
-    global llm, graph_builder
-
     cleaned_message = await remove_trigger_words(message, event)
     if not cleaned_message or cleaned_message.isspace():
         await chat_handler.finish(
@@ -272,7 +612,7 @@ async def handle_chat(
     if filter_sensitive_words(
         cleaned_message, plugin_config.sensitive_words.input_words
     ):
-        print("主消息包含敏感词，忽略处理")
+        logger.info("主消息包含敏感词，忽略处理")
         return
 
     # 检查引用消息是否包含敏感词
@@ -281,7 +621,7 @@ async def handle_chat(
         if filter_sensitive_words(
             reply_text, plugin_config.sensitive_words.input_words
         ):
-            print("引用消息包含敏感词，忽略处理")
+            logger.info("引用消息包含敏感词，忽略处理")
             return
 
     # 确保 llm 已初始化
@@ -306,21 +646,9 @@ async def handle_chat(
         message, event.reply.message if event.reply else None
     )
 
-    # 构建会话ID，创建或获取Session对象
-    if isinstance(event, GroupMessageEvent):
-        if plugin_config.plugin.group_chat_isolation:
-            thread_id = f"group_{event.group_id}_{event.user_id}"
-        else:
-            thread_id = f"group_{event.group_id}"
-    else:
-        thread_id = f"private_{event.user_id}"
-    print(f"Current thread: {thread_id}")
-
-    # 构建消息ID，传递给LangGraph
-    if isinstance(event, GroupMessageEvent):
-        message_id = f"Group_ID: {event.group_id}\nUser_ID: {event.user_id}"
-    else:
-        message_id = f"User_ID: {event.user_id}"
+    # 构建会话ID和传递给LangGraph的消息ID
+    thread_id, message_id = _thread_key(event)
+    logger.info(f"Current thread: {thread_id}")
 
     # 构建消息内容
     message_content = await build_message_content(
@@ -329,110 +657,20 @@ async def handle_chat(
 
     session = await get_or_create_session(thread_id)
 
-    # ---------- 判断当前会话ID对应的会话是否在处理中，如无则调用langgraph START ----------
-
-    # 处理会话锁
-    try:
-        if not await asyncio.wait_for(session.lock.acquire(), timeout=1.0):
-            await chat_handler.finish(
-                Message(plugin_config.responses.session_busy_message)
-            )
-            return
-    except asyncio.TimeoutError:
-        await chat_handler.finish(Message(plugin_config.responses.session_busy_message))
-        return
-
-    try:
-        if not session.try_acquire_lock():
-            await chat_handler.finish(
-                Message(plugin_config.responses.session_busy_message)
-            )
-            return
-
-        await session.start_processing()
-        # 如果当前会话没有图，则创建一个
-        if session.graph is None:
-            session.graph = graph_builder.compile(checkpointer=session.memory)
-
-        # 调用 LangGraph
-
-        # Get active tools for this session
-        active_tools = get_tools_for_skills(session.active_skills)
-
-        result = await session.graph.ainvoke(
-            {
-                "messages": [HumanMessage(content=message_content)],
-                "active_tools": active_tools,  # Pass dynamic tools to graph
-            },
-            {"configurable": {"thread_id": thread_id}},
-        )
-        truncated_messages = result["messages"][-2:]
-        print(format_messages_for_print(truncated_messages))
-
-        response = await _process_llm_response(result, thread_id)
-    except Exception as e:
-        response = await _handle_langgraph_error(e, thread_id)
-    finally:
-        await session.end_processing()
-        # 释放锁
-        session.lock.release()
+    # 开启分段发送时流式调用，每生成一个完整分段就先发送出去
+    on_chunk = None
+    if plugin_config.plugin.chunk.enable:
+        on_chunk = partial(send_stream_chunk, chat_handler=chat_handler)
 
-    # 定义媒体类型的正则和处理函数的映射
-    MEDIA_PATTERNS = {
-        "image": {
-            "pattern": r"(?:https?://|file:///)[^\s]+?\.(?:png|jpg|jpeg|gif|bmp|webp)",
-            "segment_func": MessageSegment.image,
-            "error_msg": "图片",
-        },
-        "video": {
-            "pattern": r"(?:https?://|file:///)[^\s]+?\.(?:mp4|avi|mov|mkv)",
-            "segment_func": MessageSegment.video,
-            "error_msg": "视频",
-        },
-        "audio": {
-            "pattern": r"(?:https?://|file:///)[^\s]+?\.(?:mp3|wav|ogg|aac|flac)",
-            "segment_func": MessageSegment.record,
-            "error_msg": "音频",
-        },
-    }
-
-    async def process_media_message(
-        response: str, media_type: str, url: str
-    ) -> Message:
-        """处理包含媒体的消息"""
-        media_info = MEDIA_PATTERNS[media_type]
-        if plugin_config.plugin.media_include_text:
-            # 清理markdown链接语法
-            message_content = re.sub(r"!?\[.*?\]\((.*?)\)", r"\1", response)
-            message_content = message_content.replace(url, "").strip()
-            try:
-                return Message(message_content) + media_info["segment_func"](url)
-            except ActionFailed:
-                return Message(message_content) + MessageSegment.text(
-                    f" ({media_info['error_msg']}发送失败)"
-                )
-            except MatcherException:
-                raise
-            except Exception as e:
-                return Message(message_content) + MessageSegment.text(
-                    f" (未知错误: {e})"
-                )
-        else:
-            # 仅发送媒体
-            try:
-                return Message(media_info["segment_func"](url))
-            except ActionFailed:
-                return Message(f"{media_info['error_msg']}发送失败")
-            except MatcherException:
-                raise
-            except Exception as e:
-                return Message(f"未知错误: {e}")
+    response = await _submit_message(session, thread_id, message_content, on_chunk)
+    if response is None or not response.strip():
+        # 本消息已与后续消息合并回复，或回复已全部流式发送
+        await chat_handler.finish()
 
-    # 在handle_chat函数中替换原来的媒体处理代码:
-    for media_type, info in MEDIA_PATTERNS.items():
-        if match := re.search(info["pattern"], response, re.IGNORECASE):
-            result = await process_media_message(response, media_type, match.group(0))
-            await chat_handler.finish(result)
+    # 检查回复中的媒体链接
+    if match := _MEDIA_RE.search(response):
+        result = await process_media_message(response, match.lastgroup, match.group(0))
+        await chat_handler.finish(result)
 
     # 处理纯文本消息
     if plugin_config.plugin.chunk.enable:
@@ -453,7 +691,7 @@ chat_command = on_command(
 @chat_command.handle()
 async def handle_chat_command(args: Message = CommandArg(), event: Event = None):
     """处理 chat model、chat clear、chat group 等命令"""
-    global llm, graph_builder, sessions, plugin_config
+    global llm, graph_builder, chat_graph, plugin_config
 
     command_args = args.extract_plain_text().strip().split(maxsplit=1)
     if not command_args:
@@ -494,12 +732,13 @@ async def handle_chat_command(args: Message = CommandArg(), event: Event = None)
         try:
             new_llm = await get_llm(model_name)
             new_graph_builder = await build_graph(plugin_config, new_llm)
+            new_chat_graph = new_graph_builder.compile(checkpointer=checkpointer)
             # 成功创建新实例后才更新全局变量
             llm = new_llm
             graph_builder = new_graph_builder
+            chat_graph = new_chat_graph
             # 清理所有会话
-            async with sessions_lock:
-                sessions.clear()
+            await remove_sessions()
             await chat_command.finish(f"已切换到模型: {model_name}")
         except MatcherException:
             raise
@@ -508,8 +747,7 @@ async def handle_chat_command(args: Message = CommandArg(), event: Event = None)
 
     elif command == "clear":
         # 处理清理历史会话
-        async with sessions_lock:
-            sessions.clear()
+        await remove_sessions()
         await chat_command.finish("已清理所有历史会话。")
 
     elif command == "group":
@@ -527,21 +765,14 @@ async def handle_chat_command(args: Message = CommandArg(), event: Event = None)
             await chat_command.finish("请输入 true 或 false")
 
         # 清理对应会话
-        keys_to_remove = []
         if isinstance(event, GroupMessageEvent):
             prefix = f"group_{event.group_id}"
             if plugin_config.plugin.group_chat_isolation:
-                keys_to_remove = [
-                    key for key in sessions if key.startswith(f"{prefix}_")
-                ]
+                await remove_sessions(lambda key: key.startswith(f"{prefix}_"))
             else:
-                keys_to_remove = [key for key in sessions if key == prefix]
+                await remove_sessions(lambda key: key == prefix)
         else:
-            keys_to_remove = [key for key in sessions if key.startswith("private_")]
-
-        async with sessions_lock:
-            for key in keys_to_remove:
-                del sessions[key]
+            await remove_sessions(lambda key: key.startswith("private_"))
 
         await chat_command.finish(
             f"已{'禁用' if not plugin_config.plugin.group_chat_isolation else '启用'}群聊会话隔离，已清理对应会话"
@@ -587,16 +818,10 @@ async def handle_chat_command(args: Message = CommandArg(), event: Event = None)
         action = subcommand_args[0].lower()
 
         # Get session for current context (Superuser only for now, but applies to context)
-        if isinstance(event, GroupMessageEvent):
-            if plugin_config.plugin.group_chat_isolation:
-                tid = f"group_{event.group_id}_{event.user_id}"
-            else:
-                tid = f"group_{event.group_id}"
-        elif isinstance(event, MessageEvent):  # Private
-            tid = f"private_{event.user_id}"
-        else:
+        if not isinstance(event, MessageEvent):
             await chat_command.finish("Unknown context.")
             return
+        tid, _ = _thread_key(event)
 
         session = await get_or_create_session(tid)
 
@@ -0,0 +1,43 @@
+from typing import Any, Dict, Iterator
+
+try:
+    import ahocorasick
+except ImportError:  # 未安装 pyahocorasick 时回退为逐词查找
+    ahocorasick = None
+
+
+class KeywordAutomaton:
+    """多关键词匹配器
+
+    基于 Aho-Corasick 自动机，单次扫描文本即可找出全部命中的关键词，
+    耗时与关键词数量无关。未安装 pyahocorasick 时回退为逐词查找。
+    """
+
+    def __init__(self, keywords: Dict[str, Any]):
+        """
+        Args:
+            keywords (Dict[str, Any]): 关键词 -> 命中时返回的值
+        """
+        self._keywords = {word: value for word, value in keywords.items() if word}
+        self._automaton = None
+        if ahocorasick is not None and self._keywords:
+            self._automaton = ahocorasick.Automaton()
+            for word, value in self._keywords.items():
+                self._automaton.add_word(word, value)
+            self._automaton.make_automaton()
+
+    def iter(self, text: str) -> Iterator[Any]:
+        """按命中顺序产出关键词对应的值(同一值可能出现多次)"""
+        if self._automaton is not None:
+            for _, value in self._automaton.iter(text):
+                yield value
+        else:
+            for word, value in self._keywords.items():
+                if word in text:
+                    yield value
+
+    def search(self, text: str) -> bool:
+        """文本中是否包含任一关键词"""
+        for _ in self.iter(text):
+            return True
+        return False
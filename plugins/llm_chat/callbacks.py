@@ -2,6 +2,7 @@ from langchain_core.callbacks import BaseCallbackHandler
 from typing import Any, Dict, List, Optional, Union
 from uuid import UUID
 from langchain_core.outputs import LLMResult
+from .log import logger
 
 
 class ToolLoggingCallback(BaseCallbackHandler):
@@ -19,7 +20,7 @@ class ToolLoggingCallback(BaseCallbackHandler):
         **kwargs: Any,
     ) -> Any:
         """Run when tool starts running."""
-        print(f"\n[Tool Start] 🛠️  {serialized.get('name')} input: {input_str}")
+        logger.info(f"\n[Tool Start] 🛠️  {serialized.get('name')} input: {input_str}")
 
     def on_tool_end(
         self,
@@ -32,7 +33,7 @@ class ToolLoggingCallback(BaseCallbackHandler):
         """Run when tool ends running."""
         # Truncate long output for readability
         print_output = output[:500] + "..." if len(output) > 500 else output
-        print(f"[Tool End] ✅ Output: {print_output}\n")
+        logger.info(f"[Tool End] ✅ Output: {print_output}\n")
 
     def on_tool_error(
         self,
@@ -43,4 +44,4 @@ class ToolLoggingCallback(BaseCallbackHandler):
         **kwargs: Any,
     ) -> Any:
         """Run when tool errors."""
-        print(f"[Tool Error] ❌ {error}\n")
+        logger.error(f"[Tool Error] ❌ {error}\n")
@@ -0,0 +1,83 @@
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import Checkpoint, CheckpointMetadata, ChannelVersions
+from langgraph.checkpoint.memory import MemorySaver
+
+
+class SessionMemorySaver(MemorySaver):
+    """所有会话共享的内存 checkpointer，按 thread_id 隔离并支持删除会话历史"""
+
+    def delete_thread(self, thread_id: str) -> None:
+        """删除指定会话的全部 checkpoint"""
+        self.storage.pop(thread_id, None)
+        for key in [key for key in self.writes if key[0] == thread_id]:
+            del self.writes[key]
+        # 新版 MemorySaver 将通道数据单独存放在 blobs 中
+        blobs = getattr(self, "blobs", None)
+        if blobs:
+            for key in [key for key in blobs if key[0] == thread_id]:
+                del blobs[key]
+
+    def clear(self) -> None:
+        """删除所有会话的 checkpoint"""
+        self.storage.clear()
+        self.writes.clear()
+        blobs = getattr(self, "blobs", None)
+        if blobs:
+            blobs.clear()
+
+
+class BoundedMemorySaver(SessionMemorySaver):
+    """按会话 LRU 淘汰的 checkpointer，最多保留 max_threads 个会话的历史
+
+    写入 checkpoint 时刷新会话的访问顺序，超出上限时淘汰最久未写入的会话；
+    is_busy 返回 True 的会话(正在调用中)跳过淘汰，避免中途丢失状态。
+    """
+
+    def __init__(
+        self,
+        max_threads: int = 512,
+        is_busy: Optional[Callable[[str], bool]] = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.max_threads = max_threads
+        self.is_busy = is_busy
+        self._threads: "OrderedDict[str, None]" = OrderedDict()
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        result = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = config["configurable"]["thread_id"]
+        self._threads[thread_id] = None
+        self._threads.move_to_end(thread_id)
+        if len(self._threads) > self.max_threads:
+            self._evict()
+        return result
+
+    def _evict(self) -> None:
+        """淘汰最久未使用的会话直至不超过上限"""
+        busy = []
+        while len(self._threads) > self.max_threads:
+            thread_id, _ = self._threads.popitem(last=False)
+            if self.is_busy is not None and self.is_busy(thread_id):
+                busy.append(thread_id)
+                continue
+            super().delete_thread(thread_id)
+        for thread_id in reversed(busy):
+            self._threads[thread_id] = None
+            self._threads.move_to_end(thread_id, last=False)
+
+    def delete_thread(self, thread_id: str) -> None:
+        self._threads.pop(thread_id, None)
+        super().delete_thread(thread_id)
+
+    def clear(self) -> None:
+        self._threads.clear()
+        super().clear()
@@ -20,7 +20,10 @@ class LLMConfig(BaseModel):
     max_tokens: int = 1000
     system_prompt: Optional[str] = None
     max_context_messages: int = 10
+    max_context_tokens: int = 0  # 历史消息 token 上限, 0 表示不按 token 修剪
     qa_pairs: List[Tuple[str, str]] = []
+    cache_backend: str = ""  # LLM 响应缓存: memory / sqlite / redis, 留空关闭
+    cache_url: str = ""  # sqlite 数据库路径或 redis 连接地址
 
 
 class ChunkConfig(BaseModel):
@@ -94,6 +97,7 @@ class Config(BaseModel):
                 temperature=toml_config["llm"].get("temperature", 0.7),
                 max_tokens=toml_config["llm"].get("max_tokens", 2000),
                 max_context_messages=toml_config["llm"].get("max_context_messages", 10),
+                max_context_tokens=toml_config["llm"].get("max_context_tokens", 0),
                 system_prompt=toml_config["llm"].get("system_prompt"),
                 google_api_key=toml_config["llm"].get("google_api_key", ""),
                 top_p=toml_config["llm"].get("top_p", 1.0),
@@ -101,6 +105,8 @@ class Config(BaseModel):
                 xai_api_key=toml_config["llm"].get("xai_api_key", ""),
                 openrouter_api_key=toml_config["llm"].get("openrouter_api_key", ""),
                 qa_pairs=toml_config["llm"].get("qa_pairs", []),
+                cache_backend=toml_config["llm"].get("cache_backend", ""),
+                cache_url=toml_config["llm"].get("cache_url", ""),
             )
 
             plugin_config = PluginConfig(
@@ -1,94 +1,207 @@
 from langchain_core.tools import tool
-from typing import List, Dict, Optional, Any
+from langchain_core.runnables import RunnableConfig
+from typing import List, Dict, Optional, Any, Tuple, Callable, Iterator
+from collections import OrderedDict
+import codecs
 import os
-import requests
+import httpx
 import re
 import glob
 import json
+import asyncio
+import threading
+import time
 from bs4 import BeautifulSoup
 
+try:
+    import lxml  # noqa: F401
+
+    _HTML_PARSER = "lxml"
+except ImportError:
+    _HTML_PARSER = "html.parser"
+
 from .skills import SKILL_DESCRIPTIONS, get_content_for_skills
 
+# --- Per-thread State ---
+
+
+class ThreadStore:
+    """
+    Per-thread key/value store.
+
+    Tools may run in worker threads, so entries are sharded by thread_id with
+    one lock per shard. Values are replaced wholesale (store immutable values)
+    so readers never see a half-updated entry.
+    """
+
+    def __init__(self, shards: int = 16):
+        self._shards: List[Dict[str, Any]] = [{} for _ in range(shards)]
+        self._locks = [threading.RLock() for _ in range(shards)]
+
+    def _index(self, thread_id: str) -> int:
+        return hash(thread_id) % len(self._shards)
+
+    def get(self, thread_id: str, default: Any = None) -> Any:
+        index = self._index(thread_id)
+        with self._locks[index]:
+            return self._shards[index].get(thread_id, default)
+
+    def set(self, thread_id: str, value: Any) -> None:
+        index = self._index(thread_id)
+        with self._locks[index]:
+            self._shards[index][thread_id] = value
+
+    def update(
+        self, thread_id: str, func: Callable[[Any], Any], default: Any = None
+    ) -> Any:
+        """Atomically replace the value with func(old_value) and return it."""
+        index = self._index(thread_id)
+        with self._locks[index]:
+            value = func(self._shards[index].get(thread_id, default))
+            self._shards[index][thread_id] = value
+            return value
+
+    def pop(self, thread_id: str, default: Any = None) -> Any:
+        index = self._index(thread_id)
+        with self._locks[index]:
+            return self._shards[index].pop(thread_id, default)
+
+    def clear(self) -> None:
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                shard.clear()
+
+
+def get_thread_id(config: Optional[RunnableConfig]) -> str:
+    """Read the LangGraph thread_id from a runnable config."""
+    if not config:
+        return "default"
+    return config.get("configurable", {}).get("thread_id", "default")
+
+
+def forget_thread(thread_id: Optional[str] = None) -> None:
+    """Drop per-thread tool state; all threads if thread_id is None."""
+    for store in (TODO_STORE, SKILL_STORE):
+        if thread_id is None:
+            store.clear()
+        else:
+            store.pop(thread_id)
+
+
 # --- Todo Tool ---
 # In-memory storage for simplicity. In production, use database/redis.
-TODO_STORE: Dict[str, List[str]] = {}
+# thread_id -> list of todo dicts
+TODO_STORE = ThreadStore()
 
 # --- Skill Tool ---
 # In-memory storage for active skills per thread
-SKILL_STORE: Dict[str, set] = {}
+# thread_id -> frozenset of skill names
+SKILL_STORE = ThreadStore()
 
 
 @tool(parse_docstring=True)
-def skill_setup(action: str, skill_name: str) -> str:
+def skill_setup(action: str, skill_name: str, config: RunnableConfig) -> str:
     """
     Enable or disable a skill. Use this when you need specialized knowledge or tools.
 
     Args:
         action: 'enable' or 'disable'.
         skill_name: The name of the skill (e.g., 'sgu', 'python-coding').
+        config: Runtime config injected by LangGraph (not set by the model).
 
     Returns:
         Result message.
     """
-    thread_id = "default"  # simplified
-    if thread_id not in SKILL_STORE:
-        SKILL_STORE[thread_id] = set()
+    thread_id = get_thread_id(config)
 
     if action == "enable":
         if skill_name not in SKILL_DESCRIPTIONS:
             return f"Error: Skill '{skill_name}' not found. Available: {list(SKILL_DESCRIPTIONS.keys())}"
-        SKILL_STORE[thread_id].add(skill_name)
+        SKILL_STORE.update(thread_id, lambda s: s | {skill_name}, frozenset())
         return f"Skill '{skill_name}' enabled. Knowledge will be injected in the next turn."
     elif action == "disable":
-        SKILL_STORE[thread_id].discard(skill_name)
+        SKILL_STORE.update(thread_id, lambda s: s - {skill_name}, frozenset())
         return f"Skill '{skill_name}' disabled."
     else:
         return "Error: Action must be 'enable' or 'disable'."
 
 
 @tool(parse_docstring=True)
-def todo_write(todos: List[Dict[str, str]]) -> str:
+def todo_write(todos: List[Dict[str, str]], config: RunnableConfig) -> str:
     """
     Create or update the todo list.
 
     Args:
         todos: A list of todo items, each with 'content' (string) and 'status' ('pending'/'in_progress'/'completed').
+        config: Runtime config injected by LangGraph (not set by the model).
 
     Returns:
         Confirmation message with current count.
     """
-    # Simplified: We just replace the list for the default thread
-    # Real implementation needs thread_id context
-    thread_id = "default"
-
-    # Store as simple strings for now to match previous logic, or complex objects
-    # Let's store the raw dicts
-    TODO_STORE[thread_id] = todos
+    # Store the raw dicts, replacing the list for this thread
+    TODO_STORE.set(get_thread_id(config), list(todos))
 
     pending = len([t for t in todos if t.get("status") != "completed"])
     return f"Updated todo list. {pending} tasks pending."
 
 
 @tool(parse_docstring=True)
-def todo_read() -> str:
+def todo_read(config: RunnableConfig) -> str:
     """
     Read the current todo list.
 
+    Args:
+        config: Runtime config injected by LangGraph (not set by the model).
+
     Returns:
         JSON string of the todo list.
     """
-    thread_id = "default"
-    todos = TODO_STORE.get(thread_id, [])
-    import json
-
+    todos = TODO_STORE.get(get_thread_id(config), [])
     return json.dumps(todos, indent=2, ensure_ascii=False)
 
 
 # --- Web Tools ---
 
+# Shared client so repeated fetches reuse pooled keep-alive connections
+_HTTP = httpx.AsyncClient(
+    headers={"User-Agent": "Mozilla/5.0 Bot"},
+    timeout=15.0,
+    follow_redirects=True,
+    limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+)
+
+# web_fetch result cache: url -> (fetched_at, content), kept in LRU order
+WEB_FETCH_CACHE_SIZE = 256
+WEB_FETCH_CACHE_TTL = 300  # seconds
+_FETCH_CACHE: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+# url -> event set once the in-flight fetch of that url finishes
+_FETCH_INFLIGHT: Dict[str, asyncio.Event] = {}
+
+
+EXA_MCP_URL = "https://mcp.exa.ai/mcp"
+_EXA_HEADERS = {
+    "accept": "application/json, text/event-stream",
+    "content-type": "application/json",
+}
+
+
+def _iter_exa_texts(body: str) -> Iterator[str]:
+    """Yield text items from an Exa MCP event-stream response."""
+    for line in body.splitlines():
+        if not line.startswith("data: "):
+            continue
+        try:
+            data = json.loads(line[6:])
+        except json.JSONDecodeError:
+            continue
+        if "result" in data and "content" in data["result"]:
+            for item in data["result"]["content"]:
+                if item["type"] == "text":
+                    yield item["text"]
+
 
 @tool(parse_docstring=True)
-def web_search(query: str) -> str:
+async def web_search(query: str) -> str:
     """
     Search the web using Exa AI.
 
@@ -98,7 +211,6 @@ def web_search(query: str) -> str:
     Returns:
         Search results.
     """
-    url = "https://mcp.exa.ai/mcp"
     payload = {
         "jsonrpc": "2.0",
         "id": 1,
@@ -108,38 +220,69 @@ def web_search(query: str) -> str:
             "arguments": {"query": query, "numResults": 5, "type": "auto"},
         },
     }
-    headers = {
-        "accept": "application/json, text/event-stream",
-        "content-type": "application/json",
-    }
 
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=15)
+        response = await _HTTP.post(EXA_MCP_URL, json=payload, headers=_EXA_HEADERS)
         response.raise_for_status()
 
-        output = []
-        for line in response.text.splitlines():
-            if line.startswith("data: "):
-                try:
-                    data = json.loads(line[6:])
-                    if "result" in data and "content" in data["result"]:
-                        for item in data["result"]["content"]:
-                            if item["type"] == "text":
-                                output.append(item["text"])
-                except json.JSONDecodeError:
-                    continue
-
+        output = "\n\n---\n\n".join(_iter_exa_texts(response.text))
         if not output:
             return "No search results found."
 
-        return "\n\n---\n\n".join(output)
+        return output
 
     except Exception as e:
         return f"Search error: {str(e)}"
 
 
+def _extract_text(html: bytes) -> str:
+    """Simple HTML to Text conversion."""
+    soup = BeautifulSoup(html, _HTML_PARSER)
+
+    # Remove junk
+    for tag in soup(["script", "style", "nav", "footer"]):
+        tag.decompose()
+
+    text = soup.get_text(separator="\n")
+
+    # Cleanup
+    return "\n".join(filter(None, (line.strip() for line in text.splitlines())))
+
+
+def _fetch_cache_get(url: str) -> Optional[str]:
+    """Return a fresh cached page for url, or None."""
+    entry = _FETCH_CACHE.get(url)
+    if entry is None:
+        return None
+    fetched_at, content = entry
+    if time.monotonic() - fetched_at > WEB_FETCH_CACHE_TTL:
+        del _FETCH_CACHE[url]
+        return None
+    _FETCH_CACHE.move_to_end(url)
+    return content
+
+
+def _fetch_cache_put(url: str, content: str) -> None:
+    """Insert a page into the cache, evicting the least recently used entry."""
+    _FETCH_CACHE[url] = (time.monotonic(), content)
+    _FETCH_CACHE.move_to_end(url)
+    while len(_FETCH_CACHE) > WEB_FETCH_CACHE_SIZE:
+        _FETCH_CACHE.popitem(last=False)
+
+
+async def _fetch_page(url: str) -> str:
+    """Download url and return its truncated text content."""
+    resp = await _HTTP.get(url)
+    resp.raise_for_status()
+
+    # Parse in a worker thread; HTML parsing is CPU-bound
+    content = await asyncio.to_thread(_extract_text, resp.content)
+
+    return content[:5000] + ("\n...(truncated)" if len(content) > 5000 else "")
+
+
 @tool(parse_docstring=True)
-def web_fetch(url: str) -> str:
+async def web_fetch(url: str) -> str:
     """
     Fetch content from a URL and convert to Markdown.
 
@@ -149,34 +292,90 @@ def web_fetch(url: str) -> str:
     Returns:
         Page content in Markdown format.
     """
+    # Serve from cache, or wait for a concurrent fetch of the same url
+    while True:
+        cached = _fetch_cache_get(url)
+        if cached is not None:
+            return cached
+        pending = _FETCH_INFLIGHT.get(url)
+        if pending is None:
+            break
+        await pending.wait()
+
+    done = _FETCH_INFLIGHT[url] = asyncio.Event()
     try:
-        headers = {"User-Agent": "Mozilla/5.0 Bot"}
-        resp = requests.get(url, headers=headers, timeout=15)
-        resp.raise_for_status()
-
-        # Simple HTML to Text conversion
-        soup = BeautifulSoup(resp.text, "html.parser")
-
-        # Remove junk
-        for tag in soup(["script", "style", "nav", "footer"]):
-            tag.decompose()
-
-        text = soup.get_text(separator="\n\n")
-
-        # Cleanup
-        lines = [line.strip() for line in text.splitlines() if line.strip()]
-        content = "\n".join(lines)
-
-        return content[:5000] + ("\n...(truncated)" if len(content) > 5000 else "")
+        content = await _fetch_page(url)
+        _fetch_cache_put(url, content)
+        return content
     except Exception as e:
         return f"Fetch error: {str(e)}"
+    finally:
+        del _FETCH_INFLIGHT[url]
+        done.set()
 
 
 # --- Code/Grep Tool ---
 
+GREP_MAX_RESULTS = 50
+GREP_MAX_WORKERS = 16
+# Bytes read per block; memory per scanned file stays near this size
+GREP_BLOCK_SIZE = 1 << 20
+
+
+def _iter_line_blocks(file_path: str) -> Iterator[str]:
+    """Yield a file's decoded text in blocks of whole lines (about GREP_BLOCK_SIZE)."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    carry = ""
+    with open(file_path, "rb") as f:
+        while data := f.read(GREP_BLOCK_SIZE):
+            text = carry + decoder.decode(data)
+            cut = text.rfind("\n") + 1
+            # The partial last line is carried into the next block
+            carry = text[cut:]
+            if cut:
+                yield text[:cut]
+    text = carry + decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+def _grep_file(file_path: str, regex: "re.Pattern[str]", limit: int) -> List[str]:
+    """
+    Scan a single file for regex matches.
+
+    The file is decoded in bounded blocks of whole lines and each block is
+    searched with one finditer pass (a str pattern, so ``\\w``, ``\\b`` and
+    IGNORECASE follow Unicode rules); line numbers are derived by counting
+    newlines between consecutive hits instead of splitting blocks into lines.
+    """
+    results: List[str] = []
+    rel_path = os.path.relpath(file_path, os.getcwd())
+    block_line_no = 1
+    for text in _iter_line_blocks(file_path):
+        line_no = block_line_no
+        counted_to = 0
+        line_end = -1
+        for match in regex.finditer(text):
+            start = match.start()
+            if start <= line_end:
+                # Already reported this line
+                continue
+            line_no += text.count("\n", counted_to, start)
+            counted_to = start
+            line_start = text.rfind("\n", 0, start) + 1
+            line_end = text.find("\n", start)
+            if line_end == -1:
+                line_end = len(text)
+            line = text[line_start:line_end].strip()
+            results.append(f"{rel_path}:{line_no}: {line}")
+            if len(results) >= limit:
+                return results
+        block_line_no += text.count("\n")
+    return results
+
 
 @tool(parse_docstring=True)
-def grep_tool(pattern: str, path: str = ".", include: str = "*") -> str:
+async def grep_tool(pattern: str, path: str = ".", include: str = "*") -> str:
     """
     Search for text patterns in files (like grep).
 
@@ -192,38 +391,54 @@ def grep_tool(pattern: str, path: str = ".", include: str = "*") -> str:
     if ".." in path or path.startswith("/"):
         return "Error: Invalid path. Stay in current directory."
 
-    results = []
     try:
         # Resolve files
         search_path = os.path.join(os.getcwd(), path) if path != "." else os.getcwd()
 
-        # Walk and match
-        regex = re.compile(pattern)
+        regex = re.compile(pattern, re.MULTILINE)
 
         # Recursive glob if using python 3.10+
-        files = glob.glob(f"{search_path}/**/{include}", recursive=True)
-
-        for file_path in files:
-            if os.path.isdir(file_path):
-                continue
-            if ".git" in file_path or "__pycache__" in file_path:
-                continue
-
-            try:
-                with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                    for i, line in enumerate(f):
-                        if regex.search(line):
-                            # Make path relative for readability
-                            rel_path = os.path.relpath(file_path, os.getcwd())
-                            results.append(f"{rel_path}:{i + 1}: {line.strip()}")
-                            if len(results) > 50:
-                                return "\n".join(results) + "\n...(truncated limit 50)"
-            except:
-                continue
+        files = await asyncio.to_thread(
+            glob.glob, f"{search_path}/**/{include}", recursive=True
+        )
+        files = [
+            file_path
+            for file_path in files
+            if ".git" not in file_path and "__pycache__" not in file_path
+        ]
+
+        # Scan files in worker threads so the event loop stays responsive
+        sem = asyncio.Semaphore(GREP_MAX_WORKERS)
+        limit_reached = asyncio.Event()
+        found = 0
+
+        async def scan(file_path: str) -> List[str]:
+            nonlocal found
+            async with sem:
+                if limit_reached.is_set() or os.path.isdir(file_path):
+                    return []
+                try:
+                    matches = await asyncio.to_thread(
+                        _grep_file, file_path, regex, GREP_MAX_RESULTS + 1
+                    )
+                except (OSError, ValueError):
+                    return []
+                found += len(matches)
+                if found > GREP_MAX_RESULTS:
+                    limit_reached.set()
+                return matches
+
+        chunks = await asyncio.gather(*(scan(file_path) for file_path in files))
+        results = [line for chunk in chunks for line in chunk]
 
         if not results:
             return "No matches found."
 
+        if len(results) > GREP_MAX_RESULTS:
+            return (
+                "\n".join(results[: GREP_MAX_RESULTS + 1]) + "\n...(truncated limit 50)"
+            )
+
         return "\n".join(results)
     except Exception as e:
         return f"Grep error: {str(e)}"
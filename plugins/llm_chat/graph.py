@@ -1,9 +1,21 @@
-from typing import Annotated, List, Union, Any, Optional, Dict
+from typing import (
+    Annotated,
+    Callable,
+    List,
+    Union,
+    Any,
+    Optional,
+    Dict,
+    FrozenSet,
+    Sequence,
+    Tuple,
+)
 from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, START
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode, tools_condition
 from langchain_core.messages import (
+    BaseMessage,
     SystemMessage,
     trim_messages,
     HumanMessage,
@@ -14,6 +26,9 @@ from langchain_openai import ChatOpenAI
 from langchain_groq import ChatGroq
 from langchain_xai import ChatXAI
 from langchain_core.language_models import LanguageModelInput
+from langchain_core.runnables import RunnableConfig
+from langchain_core.caches import BaseCache
+from langchain_core.globals import get_llm_cache, set_llm_cache
 from langchain_google_genai import (
     ChatGoogleGenerativeAI,
     HarmBlockThreshold,
@@ -22,14 +37,29 @@ from langchain_google_genai import (
 from .tools import load_tools
 from .config import Config
 from .config import plugin_config
+import asyncio
 import json
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
 from .skills import (
     get_tools_for_skills,
     get_content_for_skills,
+    match_skills,
     SKILL_DESCRIPTIONS,
 )
-from .core_tools import SKILL_STORE
+from .core_tools import SKILL_STORE, get_thread_id
 from .callbacks import ToolLoggingCallback
+from .log import logger
+
+try:
+    import tiktoken
+except ImportError:  # Token trimming falls back to character counts
+    tiktoken = None
 
 
 groq_models = {"llama3-groq-70b-8192-tool-use-preview", "llama-3.3-70b-versatile"}
@@ -75,10 +105,109 @@ class MyOpenAI(ChatOpenAI):
         return payload
 
 
+def _openai_llm(model, cfg, callbacks):
+    logger.info("使用 OpenAI")
+    return MyOpenAI(
+        model=model,
+        temperature=cfg.temperature,
+        max_tokens=cfg.max_tokens,
+        api_key=cfg.api_key,
+        base_url=cfg.base_url,
+        top_p=cfg.top_p,
+        callbacks=callbacks,
+    )
+
+
+def _think_openai_llm(model, cfg, callbacks):
+    logger.info("使用标准openai")
+    return ChatOpenAI(
+        model=model,
+        max_completion_tokens=cfg.max_tokens,
+        api_key=cfg.api_key,
+        base_url=cfg.base_url,
+        callbacks=callbacks,
+    )
+
+
+def _groq_llm(model, cfg, callbacks):
+    logger.info("使用groq")
+    return ChatGroq(
+        model=model,
+        temperature=cfg.temperature,
+        max_tokens=cfg.max_tokens,
+        api_key=cfg.groq_api_key,
+        callbacks=callbacks,
+    )
+
+
+def _xai_llm(model, cfg, callbacks):
+    logger.info("使用xAI Grok")
+    return ChatXAI(
+        model=model,
+        temperature=cfg.temperature,
+        max_tokens=cfg.max_tokens,
+        xai_api_key=cfg.xai_api_key,
+        callbacks=callbacks,
+    )
+
+
+def _openrouter_llm(model, cfg, callbacks):
+    logger.info(f"使用OpenRouter: {model}")
+    return ChatOpenAI(
+        model=model,
+        temperature=cfg.temperature,
+        max_tokens=cfg.max_tokens,
+        api_key=cfg.openrouter_api_key,
+        base_url="https://openrouter.ai/api/v1",
+        callbacks=callbacks,
+    )
+
+
+def _google_llm(model, cfg, callbacks):
+    logger.info("使用google")
+    return ChatGoogleGenerativeAI(
+        model=model,
+        temperature=cfg.temperature,
+        max_tokens=cfg.max_tokens,
+        google_api_key=cfg.google_api_key,
+        top_p=cfg.top_p,
+        safety_settings={
+            HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+            HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+            HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+            HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+        },
+        callbacks=callbacks,
+    )
+
+
+# Exact model name -> factory; substring rules only apply on a miss
+_MODEL_DISPATCH: Dict[str, Callable[..., Any]] = {
+    **{name: _think_openai_llm for name in think_oai_models},
+    **{name: _groq_llm for name in groq_models},
+    **{name: _xai_llm for name in xai_models},
+}
+
+
+def _resolve_llm_factory(model: str) -> Callable[..., Any]:
+    """按模型名选择 LLM 构造函数"""
+    factory = _MODEL_DISPATCH.get(model)
+    if factory is not None:
+        return factory
+    if model.startswith("grok"):
+        return _xai_llm
+    if "/" in model:
+        return _openrouter_llm
+    if "gemini" in model:
+        return _google_llm
+    return _openai_llm
+
+
 async def get_llm(model=None):
     """异步获取适当的 LLM 实例"""
-    model = model.lower() if model else plugin_config.llm.model
-    print(f"使用模型: {model}")
+    cfg = plugin_config.llm
+    model = model.lower() if model else cfg.model
+    logger.info(f"使用模型: {model}")
 
     # Configure callbacks
     callbacks = []
@@ -86,89 +215,213 @@ async def get_llm(model=None):
         callbacks.append(ToolLoggingCallback())
 
     try:
-        if (
-            hasattr(plugin_config.llm, "force_openai")
-            and plugin_config.llm.force_openai
-        ):
-            print("强制使用 OpenAI 通道")
-            return MyOpenAI(
-                model=model,
-                temperature=plugin_config.llm.temperature,
-                max_tokens=plugin_config.llm.max_tokens,
-                api_key=plugin_config.llm.api_key,
-                base_url=plugin_config.llm.base_url,
-                top_p=plugin_config.llm.top_p,
-                callbacks=callbacks,
-            )
+        if getattr(cfg, "force_openai", False):
+            logger.info("强制使用 OpenAI 通道")
+            factory = _openai_llm
+        else:
+            factory = _resolve_llm_factory(model)
+        return factory(model, cfg, callbacks)
+    except Exception as e:
+        logger.error(f"模型初始化失败: {str(e)}")
+        raise
 
-        if model in think_oai_models:
-            print("使用标准openai")
-            return ChatOpenAI(
-                model=model,
-                max_completion_tokens=plugin_config.llm.max_tokens,
-                api_key=plugin_config.llm.api_key,
-                base_url=plugin_config.llm.base_url,
-                callbacks=callbacks,
-            )
 
-        if model in groq_models:
-            print("使用groq")
-            return ChatGroq(
-                model=model,
-                temperature=plugin_config.llm.temperature,
-                max_tokens=plugin_config.llm.max_tokens,
-                api_key=plugin_config.llm.groq_api_key,
-                callbacks=callbacks,
-            )
-        elif model in xai_models or model.startswith("grok"):
-            print("使用xAI Grok")
-            return ChatXAI(
-                model=model,
-                temperature=plugin_config.llm.temperature,
-                max_tokens=plugin_config.llm.max_tokens,
-                xai_api_key=plugin_config.llm.xai_api_key,
-                callbacks=callbacks,
-            )
-        elif "/" in model:
-            print(f"使用OpenRouter: {model}")
-            return ChatOpenAI(
-                model=model,
-                temperature=plugin_config.llm.temperature,
-                max_tokens=plugin_config.llm.max_tokens,
-                api_key=plugin_config.llm.openrouter_api_key,
-                base_url="https://openrouter.ai/api/v1",
-                callbacks=callbacks,
-            )
-        elif "gemini" in model:
-            print("使用google")
-            return ChatGoogleGenerativeAI(
-                model=model,
-                temperature=plugin_config.llm.temperature,
-                max_tokens=plugin_config.llm.max_tokens,
-                google_api_key=plugin_config.llm.google_api_key,
-                top_p=plugin_config.llm.top_p,
-                safety_settings={
-                    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-                    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-                    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-                    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-                },
-                callbacks=callbacks,
-            )
+# Entries kept by the "memory" LLM cache backend
+LLM_MEMORY_CACHE_SIZE = 1024
+
+
+def setup_llm_cache(backend: str, url: str = "") -> None:
+    """按配置设置全局 LLM 响应缓存 (memory / sqlite / redis)"""
+    backend = (backend or "").lower()
+    if not backend:
+        return
+
+    try:
+        if backend == "memory":
+            from langchain_core.caches import InMemoryCache
+
+            cache = InMemoryCache(maxsize=LLM_MEMORY_CACHE_SIZE)
+        elif backend == "sqlite":
+            from langchain_community.cache import SQLiteCache
+
+            cache = SQLiteCache(database_path=url or ".langchain_cache.db")
+        elif backend == "redis":
+            import redis
+            from langchain_community.cache import RedisCache
+
+            client = redis.Redis.from_url(url or "redis://localhost:6379/0")
+            cache = RedisCache(redis_=client)
         else:
-            print("使用 OpenAI")
-            return MyOpenAI(
-                model=model,
-                temperature=plugin_config.llm.temperature,
-                max_tokens=plugin_config.llm.max_tokens,
-                api_key=plugin_config.llm.api_key,
-                base_url=plugin_config.llm.base_url,
-                top_p=plugin_config.llm.top_p,
-                callbacks=callbacks,
-            )
+            logger.warning(f"未知的缓存后端: {backend}, 已禁用 LLM 缓存")
+            return
     except Exception as e:
-        print(f"模型初始化失败: {str(e)}")
-        raise
+        logger.error(f"LLM 缓存初始化失败 ({backend}): {e}")
+        return
+
+    set_llm_cache(IdFreeCache(cache))
+    logger.info(f"已启用 LLM 响应缓存: {backend}")
+
+
+def _without_message_id(generation: Any) -> Any:
+    message = getattr(generation, "message", None)
+    if message is None or not message.id:
+        return generation
+    return generation.model_copy(
+        update={"message": message.model_copy(update={"id": None})}
+    )
+
+
+class IdFreeCache(BaseCache):
+    """存入前去掉回复的消息 id 的缓存包装, 命中时不会带回上一次回复的 id"""
+
+    def __init__(self, cache: BaseCache):
+        self.cache = cache
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Any]]:
+        return self.cache.lookup(prompt, llm_string)
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Any]) -> None:
+        self.cache.update(
+            prompt, llm_string, [_without_message_id(g) for g in return_val]
+        )
+
+    def clear(self, **kwargs: Any) -> None:
+        self.cache.clear(**kwargs)
+
+    async def alookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Any]]:
+        return await self.cache.alookup(prompt, llm_string)
+
+    async def aupdate(
+        self, prompt: str, llm_string: str, return_val: Sequence[Any]
+    ) -> None:
+        await self.cache.aupdate(
+            prompt, llm_string, [_without_message_id(g) for g in return_val]
+        )
+
+    async def aclear(self, **kwargs: Any) -> None:
+        await self.cache.aclear(**kwargs)
+
+
+def normalize_for_cache(messages: List[BaseMessage]) -> List[BaseMessage]:
+    """去掉消息 id (add_messages 会分配随机 uuid) 和用量元数据, 使 LLM 缓存键只取决于内容"""
+    stripped = []
+    for m in messages:
+        update: Dict[str, Any] = {}
+        if m.id:
+            update["id"] = None
+        if m.response_metadata:
+            update["response_metadata"] = {}
+        if getattr(m, "usage_metadata", None):
+            # 缓存命中的回复会带上 total_cost, 与首次生成的回复不同
+            update["usage_metadata"] = None
+        stripped.append(m.model_copy(update=update) if update else m)
+    return stripped
+
+
+class BindToolsCache:
+    """LRU cache of ``llm.bind_tools()`` results.
+
+    Binding converts every tool into a provider schema, which is costly and
+    synchronous; the active tool set changes rarely, so the bound runnable is
+    reused across turns. Keyed on the LLM instance and the (order
+    independent) set of tool names.
+    """
+
+    def __init__(self, max_size: int = 128, enabled: bool = True):
+        self.max_size = max_size
+        self.enabled = enabled
+        self._cache: "OrderedDict[Tuple[int, str, Any], Any]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def tool_signature(tools: Sequence[Any]) -> str:
+        names = "\0".join(sorted(t.name for t in tools))
+        return hashlib.sha256(names.encode()).hexdigest()
+
+    @staticmethod
+    def _bind(llm, tools: Sequence[Any], tool_choice: Any):
+        if tool_choice is None:
+            return llm.bind_tools(tools)
+        return llm.bind_tools(tools, tool_choice=tool_choice)
+
+    def get(self, llm, tools: Sequence[Any], tool_choice: Any = None):
+        if not self.enabled:
+            return self._bind(llm, tools, tool_choice)
+
+        # The cached binding references llm, so id(llm) stays unique while cached
+        key = (id(llm), self.tool_signature(tools), tool_choice)
+        with self._lock:
+            bound = self._cache.get(key)
+            if bound is not None:
+                self._cache.move_to_end(key)
+                return bound
+
+        bound = self._bind(llm, tools, tool_choice)
+        with self._lock:
+            self._cache[key] = bound
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return bound
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+
+BIND_TOOLS_CACHE = BindToolsCache(
+    max_size=int(os.getenv("BIND_TOOLS_CACHE_MAX_SIZE", "128")),
+    enabled=os.getenv("BIND_TOOLS_CACHE_ENABLED", "true").lower()
+    not in ("0", "false", "no", "off"),
+)
+
+
+# Threads whose tool binding chatbot remembers between turns
+THREAD_BINDINGS_MAX_SIZE = 512
+# (skills, keyword-matched skills, tool module names, tools, bound llm)
+ThreadBinding = Tuple[FrozenSet[str], FrozenSet[str], Tuple[str, ...], List[Any], Any]
+
+
+def get_bound_llm(llm, current_tools: Sequence[Any], tool_choice: Any = None):
+    """Return ``llm`` bound to ``current_tools``, reusing a cached binding."""
+    return BIND_TOOLS_CACHE.get(llm, current_tools, tool_choice)
+
+
+# Prompt blocks are kept terse: they are sent with every request
+SKILL_SYSTEM_HEADER = "\n\n### Skills (toggle with skill_setup)\n"
+
+# Stronger Tool Use Instruction
+TOOL_USE_INSTRUCTION = (
+    "\n### Rules\n"
+    "- Search/lookup/action needed: call the tool now; never just announce it.\n"
+    "- Need skill knowledge (e.g. SGU admission): enable it via skill_setup first.\n"
+    "- Active skills are listed at the end of this message.\n"
+)
+
+
+def build_static_system_message(system_prompt: str) -> SystemMessage:
+    """Build the turn-invariant system prompt prefix.
+
+    Only content that never changes between turns goes here (persona, skill
+    catalog, tool-use instructions) so providers can serve it from their
+    prompt cache; active skills are appended per turn by
+    ``append_system_text``.
+    """
+    parts = [system_prompt, SKILL_SYSTEM_HEADER]
+    # Inject Available Skills List (So LLM knows what it can enable)
+    parts.extend(f"{name}: {desc}\n" for name, desc in SKILL_DESCRIPTIONS.items())
+    parts.append(TOOL_USE_INSTRUCTION)
+    return SystemMessage(content="".join(parts))
+
+
+def append_system_text(static_message: SystemMessage, text: str) -> SystemMessage:
+    """Return a single system message with ``text`` after the static prefix.
+
+    Some providers reject non-consecutive system messages, so the per-turn
+    part is merged into the first one; the static bytes stay unchanged in
+    front of it.
+    """
+    return SystemMessage(content=f"{static_message.content}\n\n{text}")
 
 
 class State(TypedDict):
@@ -176,11 +429,116 @@ class State(TypedDict):
     active_tools: List[str]
 
 
+# Approximate per-message framing tokens (role markers etc.)
+MESSAGE_TOKEN_OVERHEAD = 4
+
+
+# Seconds before a failed tiktoken encoding load (e.g. offline) is retried
+ENCODING_RETRY_INTERVAL = 300
+_ENCODINGS: Dict[str, Any] = {}
+_ENCODING_FAILURES: Dict[str, float] = {}
+
+
+def _load_encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        pass  # Not an OpenAI model name; use the generic encoding
+    except Exception as e:
+        logger.warning(f"tiktoken encoding for {model} unavailable: {e}")
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken encoding o200k_base unavailable: {e}")
+        return None
+
+
+def _get_encoding(model: str):
+    """tiktoken encoding for ``model``; None if tiktoken or its data is unavailable.
+
+    Only successful loads are kept; a failure is retried after
+    ENCODING_RETRY_INTERVAL seconds.
+    """
+    encoding = _ENCODINGS.get(model)
+    if encoding is not None or tiktoken is None:
+        return encoding
+    failed_at = _ENCODING_FAILURES.get(model)
+    if failed_at is not None and time.monotonic() - failed_at < ENCODING_RETRY_INTERVAL:
+        return None
+    encoding = _load_encoding(model)
+    if encoding is None:
+        _ENCODING_FAILURES[model] = time.monotonic()
+    else:
+        _ENCODINGS[model] = encoding
+        _ENCODING_FAILURES.pop(model, None)
+    return encoding
+
+
+def make_token_counter(model: str) -> Callable[[BaseMessage], int]:
+    """Build a per-message token counter for ``trim_messages``.
+
+    Counts are memoized on the message text, so history that is re-trimmed
+    every turn is only tokenized once. The encoding is loaded on first use
+    (tiktoken may download it), which happens in the trimming worker thread
+    rather than on the event loop.
+    """
+
+    @lru_cache(maxsize=4096)
+    def count_text(encoding: Any, text: str) -> int:
+        if encoding is None:
+            return len(text)
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def token_counter(message: BaseMessage) -> int:
+        # Fallback counts are keyed on None, so they are not reused once the
+        # encoding becomes available
+        encoding = _get_encoding(model)
+        count = MESSAGE_TOKEN_OVERHEAD + count_text(encoding, message.text())
+        tool_calls = getattr(message, "tool_calls", None)
+        if tool_calls:
+            count += count_text(
+                encoding, json.dumps(tool_calls, ensure_ascii=False, default=str)
+            )
+        return count
+
+    return token_counter
+
+
 async def build_graph(config: Config, llm):
     """构建并返回对话图"""
     # Load all tools for the ToolNode execution
     # This now loads Core Tools + whatever is in config enabled
     all_enabled_tools = load_tools()
+    # chatbot's own ``config`` parameter is the per-run RunnableConfig
+    llm_config = config.llm
+
+    if plugin_config.plugin.debug:
+        logger.setLevel(logging.DEBUG)
+
+    # Constant for the lifetime of the graph; resolved once here
+    system_prompt = getattr(llm_config, "system_prompt", None) or None
+    qa_pairs = getattr(llm_config, "qa_pairs", None) or ()
+
+    static_system_message = None
+    if system_prompt:
+        static_system_message = build_static_system_message(system_prompt)
+
+    # The cache key serializes the messages, ids included; set up before this
+    llm_cache_enabled = get_llm_cache() is not None
+
+    # qa_pairs rendered once and shared by every turn
+    qa_messages: List[Union[HumanMessage, AIMessage]] = [
+        message
+        for user_content, assistant_content in qa_pairs
+        for message in (
+            HumanMessage(content=user_content),
+            AIMessage(content=assistant_content),
+        )
+    ]
+
+    # thread_id -> (skills, tool module names, tools, bound llm), LRU ordered
+    thread_bindings: "OrderedDict[str, ThreadBinding]" = OrderedDict()
 
     trimmer = trim_messages(
         strategy="last",
@@ -192,76 +550,159 @@ async def build_graph(config: Config, llm):
         end_on=("human", "tool"),
     )
 
-    async def chatbot(state: State):
+    # Optional token budget on top of the message-count limit
+    token_trimmer = None
+    if llm_config.max_context_tokens > 0:
+        token_trimmer = trim_messages(
+            strategy="last",
+            max_tokens=llm_config.max_context_tokens,
+            # The graph is rebuilt by "chat model", so count for the active model
+            token_counter=make_token_counter(
+                getattr(llm, "model_name", None)
+                or getattr(llm, "model", None)
+                or llm_config.model
+            ),
+            include_system=True,
+            allow_partial=False,
+            start_on="human",
+            end_on=("human", "tool"),
+        )
+
+    def resolve_tools(
+        active_skills: FrozenSet[str],
+    ) -> Tuple[Tuple[str, ...], List[Any], Any]:
+        # Resolve active tool modules from skills
+        active_tool_names = get_tools_for_skills(active_skills)
+        # load_tools() will always include Core Tools (skill_setup, etc.)
+        # plus the skill-specific tools we request here.
+        current_tools = load_tools(enabled_tools=active_tool_names)
+        return active_tool_names, current_tools, get_bound_llm(llm, current_tools)
+
+    def trim_history(messages: List[BaseMessage]) -> List[BaseMessage]:
+        trimmed_messages = trimmer.invoke(messages)
+        if token_trimmer is not None and trimmed_messages:
+            token_trimmed = token_trimmer.invoke(trimmed_messages)
+            if token_trimmed:
+                return token_trimmed
+            # The latest turn alone exceeds the budget; send just that turn
+            # (from the last human message) rather than nothing
+            logger.warning("Latest turn exceeds max_context_tokens; keeping it whole")
+            for i in range(len(trimmed_messages) - 1, -1, -1):
+                if isinstance(trimmed_messages[i], HumanMessage):
+                    return trimmed_messages[i:]
+        return trimmed_messages
+
+    async def chatbot(state: State, config: RunnableConfig):
         messages = state["messages"]
 
         # 1. Skill Management (LLM Controlled)
-        # Fetch active skills from the store (using default thread for now)
-        thread_id = "default"
-        active_skills = SKILL_STORE.get(thread_id, set())
-
-        # Resolve active tool modules from skills
-        active_tool_names = get_tools_for_skills(list(active_skills))
+        # Fetch active skills enabled via skill_setup in this thread
+        thread_id = get_thread_id(config)
+        active_skills = SKILL_STORE.get(thread_id, frozenset())
+        cached = thread_bindings.get(thread_id)
+
+        # Skills whose keywords appear in the latest user message are enabled
+        # for this turn as well (not persisted to the thread)
+        if cached is not None and not isinstance(messages[-1], HumanMessage):
+            # Loop-back from the tools node: the user message is unchanged, so
+            # reuse its keyword matches (skill_setup may still have changed
+            # the stored set, which is re-read above)
+            matched_skills = cached[1]
+        else:
+            last_msg = next(
+                (m.text() for m in reversed(messages) if isinstance(m, HumanMessage)),
+                "",
+            )
+            # Casefolded once; the matcher scans it in a single pass
+            matched_skills = frozenset(match_skills(last_msg.casefold()))
+        if not matched_skills <= active_skills:
+            active_skills = active_skills | matched_skills
 
         # Resolve active knowledge content
-        skill_content = get_content_for_skills(list(active_skills))
+        skill_content = get_content_for_skills(active_skills)
 
         # 2. Dynamic Tool Binding
-        # load_tools() will always include Core Tools (skill_setup, etc.)
-        # plus the skill-specific tools we request here.
-        current_tools = load_tools(enabled_tools=active_tool_names)
-        llm_with_tools = llm.bind_tools(current_tools)
+        # Reuse the previous turn's resolution while the thread's skill set
+        # is unchanged; skill_setup changes the set and forces a rebuild.
+        # Both steps are synchronous; on a miss they run concurrently in
+        # worker threads so the event loop keeps serving other sessions.
+        if cached is not None and cached[0] == active_skills:
+            _, _, active_tool_names, current_tools, llm_with_tools = cached
+            if matched_skills != cached[1]:
+                # Same skill set reached through different keyword matches
+                thread_bindings[thread_id] = (cached[0], matched_skills, *cached[2:])
+            thread_bindings.move_to_end(thread_id)
+            if token_trimmer is not None:
+                trimmed_messages = await asyncio.to_thread(trim_history, messages)
+            else:
+                trimmed_messages = trim_history(messages)
+        else:
+            (
+                (active_tool_names, current_tools, llm_with_tools),
+                trimmed_messages,
+            ) = await asyncio.gather(
+                asyncio.to_thread(resolve_tools, active_skills),
+                asyncio.to_thread(trim_history, messages),
+            )
 
-        # Logging for Debugging
-        if plugin_config.plugin.debug:
-            print(
-                f"\n[Graph] Active Skills ({len(active_skills)}): {list(active_skills)}"
+            thread_bindings[thread_id] = (
+                frozenset(active_skills),
+                matched_skills,
+                active_tool_names,
+                current_tools,
+                llm_with_tools,
+            )
+            thread_bindings.move_to_end(thread_id)
+            if len(thread_bindings) > THREAD_BINDINGS_MAX_SIZE:
+                thread_bindings.popitem(last=False)
+
+        # Logging for Debugging (arguments are only built when enabled)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "\n[Graph] Active Skills (%d): %s",
+                len(active_skills),
+                list(active_skills),
             )
-            print(
-                f"[Graph] Active Tools ({len(current_tools)}): {[t.name for t in current_tools]}"
+            logger.debug(
+                "[Graph] Active Tools (%d): %s",
+                len(current_tools),
+                [t.name for t in current_tools],
             )
 
         # 3. Message Construction
-        fixed_messages = []
-        if hasattr(config.llm, "system_prompt") and config.llm.system_prompt:
-            sp = config.llm.system_prompt
-
-            # Inject Available Skills List (So LLM knows what it can enable)
-            sp += "\n\n### Skill System\n"
-            sp += "You have access to a 'skill_setup' tool to enable/disable specialized capabilities.\n"
-            sp += "Available Skills:\n"
-            for name, desc in SKILL_DESCRIPTIONS.items():
-                status = "(Active)" if name in active_skills else "(Inactive)"
-                sp += f"- {name} {status}: {desc}\n"
-
-            # Stronger Tool Use Instruction
-            sp += "\n\n### IMPORTANT INSTRUCTION:\n"
-            sp += "If the user asks for something that requires searching, checking, or performing an action, YOU MUST USE THE TOOLS IMMEDIATELY.\n"
-            sp += "DO NOT just say 'I will search' or 'Let me check'. CALL THE TOOL directly.\n"
-            sp += "If you need specific knowledge (like SGU admission), enable the skill first using 'skill_setup'.\n"
-
-            # Inject Active Skills Knowledge
+        # [system (static prefix + dynamic tail), qa_pairs..., history...]
+        # keeps the leading bytes identical across turns for prompt caching.
+        fixed_messages: List[BaseMessage] = list(qa_messages)
+
+        if static_system_message is not None:
+            # Per-turn skill state goes after the cached prefix
+            parts = [
+                "Active skills: ",
+                ", ".join(sorted(active_skills)) if active_skills else "none",
+                "\n",
+            ]
             if skill_content:
-                sp += "\n### Active Skills Knowledge\n" + skill_content
-
-            fixed_messages.append(SystemMessage(content=sp))
-
-        if hasattr(config.llm, "qa_pairs") and config.llm.qa_pairs:
-            for user_content, assistant_content in config.llm.qa_pairs:
-                fixed_messages.append(HumanMessage(content=user_content))
-                fixed_messages.append(AIMessage(content=assistant_content))
+                parts += ("\n### Skill Knowledge\n", skill_content)
+            fixed_messages.insert(
+                0, append_system_text(static_system_message, "".join(parts))
+            )
 
-        # 修剪
-        trimmed_messages = trimmer.invoke(messages)
+        # 修剪结果为空时不调用模型
         if not trimmed_messages:
             return {"messages": []}
 
         # 合并
         messages = fixed_messages + trimmed_messages
+        if llm_cache_enabled:
+            messages = normalize_for_cache(messages)
         response = await llm_with_tools.ainvoke(messages)
+        if llm_cache_enabled:
+            # 命中时返回的是缓存中的同一对象, 复制并交给 add_messages 分配新 id
+            response = response.model_copy(update={"id": None})
 
-        if plugin_config.plugin.debug:
-            print("AI回复: \n", response)
+        # repr() of the full response is only built when it will be emitted
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("AI回复: \n%r", response)
 
         return {"messages": [response], "active_tools": active_tool_names}
 
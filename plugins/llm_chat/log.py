@@ -0,0 +1,26 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+
+# 插件日志：调用方只需将记录放入队列，由后台线程负责写入 stdout，
+# 避免在事件循环线程上进行阻塞的输出
+logger = logging.getLogger("llm_chat")
+
+
+def _setup_logger():
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    listener = logging.handlers.QueueListener(log_queue, handler)
+
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    listener.start()
+    atexit.register(listener.stop)
+
+
+_setup_logger()
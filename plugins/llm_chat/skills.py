@@ -1,4 +1,6 @@
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 import importlib
 import sys
 import re
@@ -10,9 +12,21 @@ SKILL_DESCRIPTIONS: Dict[str, str] = {}  # name -> description
 SKILL_KEYWORDS: Dict[str, List[str]] = {}  # name -> keywords
 SKILL_CONTENT: Dict[str, str] = {}  # name -> markdown_body
 
+# Threads used to read and parse SKILL.md files at startup
+SKILL_LOAD_WORKERS = 8
+
 
 import yaml
 
+from .automaton import KeywordAutomaton
+
+_FRONTMATTER_RE = re.compile(r"^---\s*\n(.*?)\n---\s*\n(.*)$", re.DOTALL)
+# libyaml-backed loader when PyYAML was built with it
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Keyword matcher over SKILL_KEYWORDS, rebuilt by _build_keyword_matcher()
+_KEYWORD_MATCHER = KeywordAutomaton({})
+
 
 def _parse_frontmatter(content: str) -> Tuple[Dict[str, Any], str]:
     """YAML frontmatter parser using PyYAML."""
@@ -20,20 +34,55 @@ def _parse_frontmatter(content: str) -> Tuple[Dict[str, Any], str]:
     body = content
 
     # Check for --- block at start
-    match = re.match(r"^---\s*\n(.*?)\n---\s*\n(.*)$", content, re.DOTALL)
-    if match:
+    if not content.startswith("---"):
+        return meta, body
+
+    # Fast path for the common "---\n...\n---\n" layout, regex for the rest
+    sep = ""
+    if content.startswith("---\n"):
+        yaml_text, sep, body = content[4:].partition("\n---\n")
+    if not sep:
+        match = _FRONTMATTER_RE.match(content)
+        if not match:
+            return meta, content
         yaml_text = match.group(1)
         body = match.group(2)
-        try:
-            parsed = yaml.safe_load(yaml_text)
-            if isinstance(parsed, dict):
-                meta = parsed
-        except yaml.YAMLError as e:
-            print(f"Error parsing YAML frontmatter: {e}")
+
+    try:
+        parsed = yaml.load(yaml_text, Loader=_YAML_LOADER)
+        if isinstance(parsed, dict):
+            meta = parsed
+    except yaml.YAMLError as e:
+        print(f"Error parsing YAML frontmatter: {e}")
 
     return meta, body
 
 
+def _load_skill(
+    skill_path: Path,
+) -> Optional[Tuple[str, Dict[str, Any], str, Optional[str]]]:
+    """Read and parse one skill directory.
+
+    Returns (skill_name, meta, body, tools module name or None), or None if
+    the skill could not be loaded.
+    """
+    try:
+        content = (skill_path / "SKILL.md").read_text(encoding="utf-8")
+        meta, body = _parse_frontmatter(content)
+
+        # Interned: these names are hashed and compared on every turn
+        skill_name = sys.intern(str(meta.get("name", skill_path.name)))
+
+        # Look for adjacent tools.py (Optional)
+        module_name = None
+        if (skill_path / "tools.py").exists():
+            module_name = sys.intern(f"skills.{skill_path.name}.tools")
+        return skill_name, meta, body, module_name
+    except Exception as e:
+        print(f"Error loading skill {skill_path.name}: {e}")
+        return None
+
+
 def _discover_skills():
     """
     Dynamically discover skills from 'skills/' directory (SKILL.md architecture).
@@ -49,78 +98,109 @@ def _discover_skills():
     if str(root_path) not in sys.path:
         sys.path.insert(0, str(root_path))
 
-    # Scan for SKILL.md
-    for skill_path in skills_dir.iterdir():
-        if not skill_path.is_dir():
+    # Scan for SKILL.md; files are read and parsed in parallel, the
+    # registry itself is only written from this thread.
+    skill_paths = [
+        skill_path
+        for skill_path in skills_dir.iterdir()
+        if skill_path.is_dir() and (skill_path / "SKILL.md").exists()
+    ]
+    with ThreadPoolExecutor(max_workers=SKILL_LOAD_WORKERS) as executor:
+        loaded = list(executor.map(_load_skill, skill_paths))
+
+    for result in loaded:
+        if result is None:
             continue
+        skill_name, meta, body, module_name = result
 
-        md_file = skill_path / "SKILL.md"
-        if not md_file.exists():
-            continue
+        # Store Metadata
+        SKILL_DESCRIPTIONS[skill_name] = meta.get("description", "")
+        SKILL_KEYWORDS[skill_name] = meta.get("keywords", [])
+        SKILL_CONTENT[skill_name] = body
+
+        # Skills without tools (Knowledge Only) still get a registry entry
+        # so they can be activated
+        if skill_name not in SKILL_REGISTRY:
+            SKILL_REGISTRY[skill_name] = []
+        if module_name is not None:
+            SKILL_REGISTRY[skill_name].append(module_name)
 
-        try:
-            content = md_file.read_text(encoding="utf-8")
-            meta, body = _parse_frontmatter(content)
-
-            skill_name = meta.get("name", skill_path.name)
-
-            # Store Metadata
-            SKILL_DESCRIPTIONS[skill_name] = meta.get("description", "")
-            SKILL_KEYWORDS[skill_name] = meta.get("keywords", [])
-            SKILL_CONTENT[skill_name] = body
-
-            # Look for adjacent tools.py (Optional)
-            tools_file = skill_path / "tools.py"
-            if tools_file.exists():
-                module_name = f"skills.{skill_path.name}.tools"
-                if skill_name not in SKILL_REGISTRY:
-                    SKILL_REGISTRY[skill_name] = []
-                SKILL_REGISTRY[skill_name].append(module_name)
-            else:
-                # Skill without tools (Knowledge Only)
-                # Ensure it exists in registry so it can be activated
-                if skill_name not in SKILL_REGISTRY:
-                    SKILL_REGISTRY[skill_name] = []
-
-        except Exception as e:
-            print(f"Error loading skill {skill_path.name}: {e}")
+    # Registry changed; drop memoized lookups
+    _tools_for_skills.cache_clear()
+    _content_for_skills.cache_clear()
+    _build_keyword_matcher()
 
     # Load default tools from config (legacy support)
     # We can still keep the config-tools.toml logic for 'default' tools if needed
-    pass
-
-
-# Initialize Registry at startup
-_discover_skills()
-
-# Log discovered skills
-if SKILL_KEYWORDS:
-    print(
-        f"[Skills] Discovered {len(SKILL_KEYWORDS)} skills: {list(SKILL_KEYWORDS.keys())}"
-    )
-    for name, kws in SKILL_KEYWORDS.items():
-        print(f"  - {name}: keywords={kws[:5]}{'...' if len(kws) > 5 else ''}")
-else:
-    print("[Skills] No skills discovered. Check skills/ directory.")
 
 
-def get_tools_for_skills(active_skills: List[str]) -> List[str]:
-    """Get unique tool modules."""
+@lru_cache(maxsize=64)
+def _tools_for_skills(skills_key: FrozenSet[str]) -> Tuple[str, ...]:
+    """Resolve tool modules for a frozen set of skill names."""
     tools = set()
     # Always include default tools (if any configured)
     if "default" in SKILL_REGISTRY:
         tools.update(SKILL_REGISTRY["default"])
 
-    for skill in active_skills:
+    for skill in skills_key:
         if skill in SKILL_REGISTRY:
             tools.update(SKILL_REGISTRY[skill])
-    return list(tools)
+    return tuple(sorted(tools))
+
+
+def get_tools_for_skills(active_skills: Iterable[str]) -> Tuple[str, ...]:
+    """Get unique tool modules (memoized per skill set)."""
+    return _tools_for_skills(frozenset(active_skills))
+
 
+def _build_keyword_matcher():
+    """(Re)build the keyword -> skills matcher from SKILL_KEYWORDS."""
+    global _KEYWORD_MATCHER
+
+    keyword_skills: Dict[str, List[str]] = {}
+    for skill_name, keywords in SKILL_KEYWORDS.items():
+        for kw in keywords or []:
+            kw = str(kw).casefold()
+            if kw and skill_name not in keyword_skills.setdefault(kw, []):
+                keyword_skills[kw].append(skill_name)
+
+    _KEYWORD_MATCHER = KeywordAutomaton(
+        {kw: tuple(names) for kw, names in keyword_skills.items()}
+    )
 
-def get_content_for_skills(active_skills: List[str]) -> str:
-    """Get concatenated Markdown content for active skills."""
+
+def match_skills(text_lower: str) -> Set[str]:
+    """Return skills whose keywords occur in ``text_lower`` (already casefolded)."""
+    matched: Set[str] = set()
+    for names in _KEYWORD_MATCHER.iter(text_lower):
+        matched.update(names)
+    return matched
+
+
+@lru_cache(maxsize=64)
+def _content_for_skills(skills_key: FrozenSet[str]) -> str:
+    """Concatenate skill bodies for a frozen set of skill names (sorted by name)."""
     content_parts = []
-    for skill in active_skills:
+    for skill in sorted(skills_key):
         if skill in SKILL_CONTENT:
             content_parts.append(f"--- Skill: {skill} ---\n{SKILL_CONTENT[skill]}")
     return "\n\n".join(content_parts)
+
+
+def get_content_for_skills(active_skills: Iterable[str]) -> str:
+    """Get concatenated Markdown content for active skills (memoized per skill set)."""
+    return _content_for_skills(frozenset(active_skills))
+
+
+# Initialize Registry at startup
+_discover_skills()
+
+# Log discovered skills
+if SKILL_KEYWORDS:
+    print(
+        f"[Skills] Discovered {len(SKILL_KEYWORDS)} skills: {list(SKILL_KEYWORDS.keys())}"
+    )
+    for name, kws in SKILL_KEYWORDS.items():
+        print(f"  - {name}: keywords={kws[:5]}{'...' if len(kws) > 5 else ''}")
+else:
+    print("[Skills] No skills discovered. Check skills/ directory.")
@@ -1,7 +1,8 @@
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
 from langchain.tools import BaseTool
 import requests
 import json
+import functools
 import importlib.util
 import sys
 import os
@@ -25,6 +26,42 @@ def _get_builtin_tools(config: dict) -> Dict[str, Any]:
     return builtin_map
 
 
+@functools.cache
+def _load_tools_config() -> dict:
+    """Read config-tools.toml once; later calls reuse the parsed dict."""
+    root_path = Path(__file__).resolve().parents[2]
+    config_path = root_path / "config-tools.toml"
+
+    try:
+        with open(config_path, "rb") as f:
+            return tomli.load(f)
+    except FileNotFoundError:
+        # Fallback if config missing, though it should exist
+        print(f"Warning: Tools config file not found at {config_path}")
+        return {}
+
+
+# Entries known to be on sys.path (set lookup instead of scanning the list)
+_KNOWN_PATHS = set(sys.path)
+
+# module name -> imported tool module
+_MODULE_CACHE: Dict[str, Any] = {}
+
+
+def _import_tool_module(name: str) -> Any:
+    """Import a tool module by name, memoizing the result."""
+    tool_module = _MODULE_CACHE.get(name)
+    if tool_module is None:
+        # Try importing as 'tools.xxx' (Legacy)
+        try:
+            tool_module = importlib.import_module(f"tools.{name.replace('-', '_')}")
+        except ModuleNotFoundError:
+            # Try importing as full module path (New Skill System)
+            tool_module = importlib.import_module(name)
+        _MODULE_CACHE[name] = tool_module
+    return tool_module
+
+
 def load_tools(
     enabled_tools: Optional[List[str]] = None, tool_paths: Optional[List[str]] = None
 ) -> List[BaseTool]:
@@ -32,20 +69,24 @@ def load_tools(
     Load tools.
     Always loads 'Builtin/Core Tools' (defined in config or defaults).
     Then loads 'enabled_tools' (modules) if provided.
+    Results are memoized per (enabled_tools, tool_paths).
     """
+    return list(
+        _load_tools_cached(
+            tuple(enabled_tools) if enabled_tools is not None else None,
+            tuple(tool_paths) if tool_paths else (),
+        )
+    )
+
+
+@functools.lru_cache(maxsize=64)
+def _load_tools_cached(
+    enabled_tools: Optional[Tuple[str, ...]], tool_paths: Tuple[str, ...]
+) -> Tuple[BaseTool, ...]:
     tools_list = []
 
-    # 1. Always load config to get environment setup and default settings
-    root_path = Path(__file__).resolve().parents[2]
-    config_path = root_path / "config-tools.toml"
-
-    try:
-        with open(config_path, "rb") as f:
-            config = tomli.load(f)
-    except FileNotFoundError:
-        # Fallback if config missing, though it should exist
-        print(f"Warning: Tools config file not found at {config_path}")
-        config = {}
+    # 1. Load (cached) config to get environment setup and default settings
+    config = _load_tools_config()
 
     # 2. Setup Environment (e.g. API Keys)
     # Exa needs no API Key setup here as it uses public MCP endpoint in web_search tool
@@ -57,7 +98,8 @@ def load_tools(
     # We load ALL builtins defined in code (CORE_TOOLS) + defaults in config
     # If config defines 'builtin', use that filter. If not, load all CORE_TOOLS?
     # For safety, let's load what's in config['tools']['builtin'] OR default to all CORE_TOOLS if config missing
-    builtin_tool_names = config.get("tools", {}).get("builtin", [])
+    # (copied: the cached config must not be mutated)
+    builtin_tool_names = list(config.get("tools", {}).get("builtin", []))
 
     # CRITICAL FIX: Ensure 'skill_setup' and 'grep' are ALWAYS loaded if they exist in factories,
     # regardless of config. This supports the new Skill System.
@@ -89,25 +131,20 @@ def load_tools(
         enabled_tools = config.get("tools", {}).get("enabled", [])
 
     search_paths = [str(Path(__file__).resolve().parents[2])]
-    if tool_paths:
-        search_paths.extend(tool_paths)
+    search_paths.extend(tool_paths)
 
     for path in search_paths:
-        if path not in sys.path:
+        if path not in _KNOWN_PATHS:
             sys.path.insert(0, path)
+            _KNOWN_PATHS.add(path)
 
     for name in enabled_tools:
         try:
-            # Try importing as 'tools.xxx' (Legacy)
-            try:
-                tool_module = importlib.import_module(f"tools.{name.replace('-', '_')}")
-            except ModuleNotFoundError:
-                # Try importing as full module path (New Skill System)
-                tool_module = importlib.import_module(name)
+            tool_module = _import_tool_module(name)
 
             if hasattr(tool_module, "tools"):
                 tools_list.extend(tool_module.tools)  # type: ignore
         except (ModuleNotFoundError, ImportError) as e:
             print(f"Error loading tool {name}: {str(e)}")
 
-    return tools_list
+    return tuple(tools_list)
@@ -8,10 +8,12 @@ from nonebot.adapters.onebot.v11 import (
 from nonebot.adapters.onebot.v11.exception import ActionFailed
 from datetime import datetime, timedelta, timezone
 from nonebot.exception import MatcherException
-from typing import List, Dict, Union, Optional
+from typing import Dict, List, Optional, Tuple, Union
 from nonebot import get_bot
 from .config import Config
+from .automaton import KeywordAutomaton
 from random import choice
+from functools import lru_cache
 import asyncio
 import re
 
@@ -165,6 +167,40 @@ async def send_in_chunks(response: str, chat_handler) -> bool:
     return False
 
 
+def split_stream_buffer(text: str, start: int = 0) -> Tuple[List[str], int]:
+    """
+    从流式输出中切出已完整的分段
+
+    Args:
+        text (str): 当前已生成的全部文本
+        start (int): 已处理到的位置
+
+    Returns:
+        Tuple[List[str], int]: 清理后的完整分段，以及新的已处理位置
+    """
+    words = [word for word in plugin_config.plugin.chunk.words if word]
+    chunks = []
+    while True:
+        hits = [(text.find(word, start), word) for word in words]
+        hits = [(index, word) for index, word in hits if index != -1]
+        if not hits:
+            return chunks, start
+        index, sep = min(hits)
+        chunk = text[start:index]
+        for word in words:
+            chunk = chunk.replace(word, "")
+        chunk = chunk.strip()
+        if chunk:
+            chunks.append(chunk)
+        start = index + len(sep)
+
+
+async def send_stream_chunk(chunk: str, chat_handler):
+    """发送流式输出中的一个完整分段"""
+    await chat_handler.send(Message(chunk))
+    await asyncio.sleep(calculate_typing_delay(chunk))
+
+
 def remove_cq_codes(message: Message) -> str:
     """从消息中移除CQ码"""
     text = str(message)
@@ -209,6 +245,12 @@ async def build_message_content(
     return message_content
 
 
+@lru_cache(maxsize=8)
+def _word_automaton(words: tuple) -> KeywordAutomaton:
+    """为词列表构建(小写)匹配自动机"""
+    return KeywordAutomaton({word.lower(): word for word in words})
+
+
 def filter_sensitive_words(text: str, word_list: List[str]) -> bool:
     """检查文本是否包含敏感词
 
@@ -221,5 +263,9 @@ def filter_sensitive_words(text: str, word_list: List[str]) -> bool:
     """
     if not text or not word_list:
         return False
-    text = text.lower()
-    return any(word.lower() in text for word in word_list)
+    return _word_automaton(tuple(word_list)).search(text.lower())
+
+
+# 启动时预先构建输入敏感词自动机
+if plugin_config.sensitive_words.input_words:
+    _word_automaton(tuple(plugin_config.sensitive_words.input_words))